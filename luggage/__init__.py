@@ -0,0 +1,3 @@
+"""
+Shared search-engine code used by the Streamlit pages
+"""
@@ -0,0 +1,112 @@
+"""
+Versioned on-disk index artifact: FAISS index, label table and file manifest
+"""
+import json
+import os
+import time
+
+from luggage.embedding_cache import PREPROCESS_VERSION
+from luggage.labels import LabelTable
+
+ARTIFACT_DIR = "cache/index"
+# 3: IVF indexes are no longer wrapped in an IndexIDMap2
+FORMAT_VERSION = 3
+
+INDEX_FILE = "index.faiss"
+LABELS_FILE = "labels.json"
+MANIFEST_FILE = "manifest.json"
+
+
+def _replace_json(path, data):
+    """Write JSON through a temporary sibling and rename it into place"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def save_artifact(index, labels, file_hashes, model_name, settings=None, output_dir=ARTIFACT_DIR):
+    """Write index, labels and manifest; the manifest is written last and marks the artifact complete"""
+    import faiss
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    index_path = os.path.join(output_dir, INDEX_FILE)
+    faiss.write_index(index, f"{index_path}.tmp")
+    os.replace(f"{index_path}.tmp", index_path)
+
+    _replace_json(os.path.join(output_dir, LABELS_FILE), labels.to_json())
+
+    files = {}
+    for image_path in labels.image_paths():
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            # Deleted since the index was published: recorded so is_stale() reports it
+            files[image_path] = [None, None, file_hashes.get(image_path)]
+            continue
+        files[image_path] = [stat.st_size, stat.st_mtime_ns,
+                             file_hashes.get(image_path)]
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "model": model_name,
+        "preprocess_version": PREPROCESS_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "ntotal": index.ntotal,
+        "index_settings": settings,
+        "files": files,
+    }
+    _replace_json(os.path.join(output_dir, MANIFEST_FILE), manifest)
+    return manifest
+
+
+def load_artifact(model_name, output_dir=ARTIFACT_DIR):
+    """Load a compatible artifact with memory-mapped I/O; return (index, labels, manifest) or None"""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if (manifest.get("format_version") != FORMAT_VERSION
+                or manifest.get("model") != model_name
+                or manifest.get("preprocess_version") != PREPROCESS_VERSION):
+            return None
+
+        import faiss
+
+        index_path = os.path.join(output_dir, INDEX_FILE)
+        mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            index = faiss.read_index(index_path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # This index type cannot be memory-mapped by the installed FAISS
+            index = faiss.read_index(index_path)
+
+        with open(os.path.join(output_dir, LABELS_FILE), 'r', encoding='utf-8') as f:
+            labels = LabelTable.from_json(json.load(f))
+    except Exception as e:
+        print(f"Ignoring unreadable index artifact in {output_dir}: {e}")
+        return None
+
+    if index.ntotal != manifest.get("ntotal"):
+        return None
+    return index, labels, manifest
+
+
+def is_stale(manifest, image_paths):
+    """Return True when the dataset images differ from those recorded in the manifest"""
+    files = manifest.get("files", {})
+    if len(files) != len(image_paths):
+        return True
+    for image_path in image_paths:
+        known = files.get(os.path.normpath(image_path))
+        if known is None:
+            return True
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return True
+        if known[0] != stat.st_size or known[1] != stat.st_mtime_ns:
+            return True
+    return False
@@ -0,0 +1,144 @@
+"""
+Optional CPU inference backends for the CLIP visual tower
+
+    "inference_backend": "fp32" (default, full PyTorch model),
+                         "int8" (dynamically quantized Linear layers) or
+                         "torchscript" (traced and frozen graph)
+
+Usage: python -m luggage.backends --backend int8 [--k 3] [--sample 200]
+compares the top-k articles of the backend against fp32 on the dataset.
+torch and faiss are only imported once a backend is actually loaded.
+"""
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from luggage.embedding_cache import get_embedding_cache
+from luggage.images import load_image
+
+BACKENDS = ("fp32", "int8", "torchscript")
+
+
+def model_key(model_name, backend="fp32"):
+    """Name under which embeddings of a model / backend pair are cached and indexed"""
+    if backend == "fp32":
+        return model_name
+    return f"{model_name}+{backend}"
+
+
+class VisualEncoder:
+    """CLIP visual tower exposed through the same encode_image call as the full model
+
+    Only the visual tower is kept, so the text transformer and token
+    embedding weights are released along with the original model.
+    """
+
+    def __init__(self, visual, dtype):
+        self.visual = visual
+        self.dtype = dtype
+
+    def encode_image(self, image):
+        return self.visual(image.type(self.dtype))
+
+
+def load_backend(model, device, backend="fp32"):
+    """Return an object with encode_image() running the requested backend"""
+    import torch
+
+    if backend not in BACKENDS:
+        print(f"Unknown inference_backend {backend!r}, using fp32")
+        backend = "fp32"
+    if backend == "fp32":
+        return model
+    if device != "cpu":
+        print(f"The {backend} backend targets CPU inference, using fp32 on {device}")
+        return model
+
+    visual = model.visual.eval()
+    if backend == "int8":
+        visual = torch.ao.quantization.quantize_dynamic(
+            visual, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend == "torchscript":
+        size = visual.input_resolution
+        with torch.no_grad():
+            traced = torch.jit.trace(visual, torch.zeros(2, 3, size, size))
+        visual = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    return VisualEncoder(visual, model.dtype)
+
+
+def _top_articles(index, embeddings, query_rows, ids, k):
+    """Return the k closest distinct articles of each query row, ignoring the query image itself"""
+    _, neighbours = index.search(  # pylint: disable=no-value-for-parameter
+        embeddings[query_rows], min(len(ids), 50))
+    results = []
+    for query_row, row in zip(query_rows, neighbours):
+        articles = []
+        for vector_id in row:
+            if vector_id >= 0 and vector_id != query_row and ids[vector_id] not in articles:
+                articles.append(ids[vector_id])
+        results.append(articles[:k])
+    return results
+
+
+def parity_check(backend, dataset_path="dataset/", k=3, sample=200, seed=0):
+    """Compare top-k articles and query latency of a backend against fp32 on the dataset"""
+    import faiss
+    import torch
+
+    # Imported here because luggage.indexing loads backends through this module
+    from luggage.indexing import (MODEL_NAME, embed_images,
+                                  list_dataset_images, load_clip)
+
+    images = list_dataset_images(dataset_path)
+    image_paths = [image_path for _, image_path in images]
+    queries = random.Random(seed).sample(range(len(images)), min(sample, len(images)))
+
+    report = {"backend": backend, "k": k, "queries": len(queries)}
+    top = {}
+    for name in ("fp32", backend):
+        encoder, preprocess, device = load_clip(MODEL_NAME, backend=name)
+        cache = get_embedding_cache(model_key(MODEL_NAME, name))
+        embeddings, kept, _, _ = embed_images(image_paths, encoder, preprocess, device, cache=cache)
+        cache.save()
+        index = faiss.IndexFlatL2(embeddings.shape[1])
+        index.add(embeddings)  # pylint: disable=no-value-for-parameter
+        ids = [images[i][0] for i in kept]
+        rows = {position: row for row, position in enumerate(kept)}
+        query_rows = [rows[q] for q in queries if q in rows]
+        top[name] = _top_articles(index, embeddings, query_rows, ids, k)
+
+        # Per-query latency of the encoder alone, batch size 1 like a customer query
+        tensor = preprocess(load_image(image_paths[queries[0]])).unsqueeze(0).to(device)
+        timings = []
+        with torch.no_grad():
+            for _ in range(20):
+                start = time.perf_counter()
+                encoder.encode_image(tensor)
+                timings.append(time.perf_counter() - start)
+        report[f"{name}_encode_ms_p50"] = float(np.percentile(timings, 50) * 1000)
+
+    pairs = list(zip(top["fp32"], top[backend]))
+    report["top1_agreement"] = float(np.mean([a[:1] == b[:1] for a, b in pairs]))
+    report[f"overlap_at_{k}"] = float(np.mean([len(set(a) & set(b)) / max(1, len(a)) for a, b in pairs]))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check a CLIP inference backend against fp32")
+    parser.add_argument("--backend", choices=BACKENDS[1:], required=True)
+    parser.add_argument("--dataset", default="dataset/")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--sample", type=int, default=200, help="number of dataset images used as queries")
+    args = parser.parse_args(argv)
+
+    report = parity_check(args.backend, args.dataset, k=args.k, sample=args.sample)
+    for key, value in report.items():
+        print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""
+Headless benchmark of index building and querying
+
+Usage: python -m luggage.bench [--dataset dataset/ | --synthetic 500] [--queries test/] [--output run.json]
+
+Builds an index from the dataset (or from generated images), then runs every
+query image through the same stages as the Accueil page and prints a JSON
+report: build throughput, per-stage query latency percentiles, peak RSS and
+index size. Reports of different commits can be diffed directly.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from luggage.config import CONFIG_PATH, load_app_config
+from luggage.images import load_image
+from luggage.index_factory import INDEX_TYPES, index_settings, inference_backend
+from luggage.indexing import (DEFAULT_BATCH_SIZE, IMAGE_EXTENSIONS, MODEL_NAME,
+                              build_index_data, list_dataset_images, load_clip)
+from luggage.live_index import ARTICLE_SEARCH_K, IndexHandle, create_index
+from luggage.labels import LabelTable
+
+QUERY_STAGES = ("decode", "preprocess", "encode", "search", "aggregate")
+PERCENTILES = (50, 95, 99)
+
+
+def make_synthetic_dataset(path, num_images, images_per_article=5, size=(640, 480), seed=0):
+    """Write num_images noisy JPEGs, one color per article, into path"""
+    rng = np.random.default_rng(seed)
+    for i in range(num_images):
+        article_id = f"S{i // images_per_article:04d}"
+        folder = os.path.join(path, article_id)
+        os.makedirs(folder, exist_ok=True)
+        color = np.random.default_rng(i // images_per_article).integers(0, 256, 3)
+        pixels = np.clip(color + rng.normal(0, 40, (size[1], size[0], 3)), 0, 255)
+        Image.fromarray(pixels.astype('uint8')).save(
+            os.path.join(folder, f"{i:05d}.jpg"), quality=90)
+    return path
+
+
+def list_query_images(queries_path, dataset_images, sample, seed=0):
+    """Return query image paths: the files of queries_path, or a sample of the dataset"""
+    if queries_path and os.path.isdir(queries_path):
+        return [os.path.join(queries_path, f) for f in sorted(os.listdir(queries_path))
+                if f.lower().endswith(IMAGE_EXTENSIONS)]
+    image_paths = [image_path for _, image_path in dataset_images]
+    return random.Random(seed).sample(image_paths, min(sample, len(image_paths)))
+
+
+def percentiles(samples):
+    """Return mean and p50/p95/p99 of samples in milliseconds"""
+    samples = np.array(samples) * 1000
+    report = {"mean_ms": float(samples.mean()) if len(samples) else 0.0}
+    for p in PERCENTILES:
+        report[f"p{p}_ms"] = float(np.percentile(samples, p)) if len(samples) else 0.0
+    return report
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def rss_mb():
+    """Current resident set size of this process in MB, or the peak where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm", 'r', encoding='utf-8') as f:
+            resident_pages = int(f.read().split()[1])
+    except OSError:
+        return peak_rss_mb()
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def model_size_bytes(model):
+    """Size of the serialized visual tower of an encoder, quantized or traced layers included
+
+    Every backend exposes the tower as .visual (the fp32 model also holds the
+    text tower, which is left out so that the backends compare).
+    """
+    import torch
+
+    visual = model.visual
+    buffer = io.BytesIO()
+    if isinstance(visual, torch.jit.ScriptModule):
+        # Frozen graphs keep their weights as constants, outside the state dict
+        torch.jit.save(visual, buffer)
+    else:
+        torch.save(visual.state_dict(), buffer)
+    return buffer.tell()
+
+
+def index_size_bytes(index):
+    """Size of the serialized FAISS index"""
+    import faiss
+
+    return int(faiss.serialize_index(index).size)
+
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def query_stages(handle, image_paths, model, preprocess, device, num_results, repeat=1):
+    """Time every query stage; return {stage: [seconds, ...]}"""
+    import torch
+
+    timings = {stage: [] for stage in QUERY_STAGES}
+    k = min(max(ARTICLE_SEARCH_K, num_results), handle.ntotal)
+    for image_path in image_paths:
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            image = load_image(io.BytesIO(data))
+            decoded = time.perf_counter()
+            tensor = preprocess(image).unsqueeze(0).to(device)
+            preprocessed = time.perf_counter()
+            with torch.no_grad():
+                query = model.encode_image(tensor).float().cpu().numpy()
+            encoded = time.perf_counter()
+            distances, vector_ids = handle.search(query, k)
+            searched = time.perf_counter()
+            handle.aggregate(distances[0], vector_ids[0], num_results)
+            aggregated = time.perf_counter()
+
+            timings["decode"].append(decoded - start)
+            timings["preprocess"].append(preprocessed - decoded)
+            timings["encode"].append(encoded - preprocessed)
+            timings["search"].append(searched - encoded)
+            timings["aggregate"].append(aggregated - searched)
+    return timings
+
+
+def run(dataset_path, queries_path, settings, batch_size=DEFAULT_BATCH_SIZE, num_workers=None,
+        num_results=3, sample=50, repeat=1):
+    """Build an index of dataset_path and time queries against it; return the report dict"""
+    backend = inference_backend(settings)
+    start = time.perf_counter()
+    model, preprocess, device = load_clip(MODEL_NAME, backend=backend)
+    model_seconds = time.perf_counter() - start
+
+    # No embedding cache: every image is decoded and encoded
+    article_ids, image_paths, embeddings, failures, stats = build_index_data(
+        model, preprocess, device, cache=None, dataset_path=dataset_path,
+        batch_size=batch_size, num_workers=num_workers)
+    if not article_ids:
+        raise ValueError(f"no valid image in {dataset_path}")
+    start = time.perf_counter()
+    index = create_index(embeddings, settings)
+    index_seconds = time.perf_counter() - start
+    handle = IndexHandle(index, LabelTable.from_paths(article_ids, image_paths), 1, settings)
+
+    queries = list_query_images(queries_path, list_dataset_images(dataset_path), sample)
+    timings = query_stages(handle, queries, model, preprocess, device, num_results, repeat)
+    total = [sum(stage) for stage in zip(*timings.values())]
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "settings": settings,
+        "model_load_seconds": model_seconds,
+        "build": {
+            "images": stats["images"],
+            "failed": len(failures),
+            "encode_seconds": stats["seconds"],
+            "images_per_sec": stats["images_per_sec"],
+            "index_seconds": index_seconds,
+            "index_size_bytes": index_size_bytes(index),
+        },
+        "query": {
+            "queries": len(queries),
+            "repeat": repeat,
+            "stages": {stage: percentiles(samples) for stage, samples in timings.items()},
+            "total": percentiles(total),
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark index building and querying")
+    parser.add_argument("--dataset", default="dataset/")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="benchmark this many generated images instead of --dataset")
+    parser.add_argument("--queries", default="test/",
+                        help="folder of query images; defaults to a sample of the dataset when missing")
+    parser.add_argument("--sample", type=int, default=50, help="dataset images used as queries without --queries")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each query")
+    parser.add_argument("--num-results", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--config", default=CONFIG_PATH)
+    parser.add_argument("--index-type", choices=INDEX_TYPES)
+    parser.add_argument("--backend", help="inference backend, overrides the config")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    config = load_app_config(args.config)
+    if args.index_type:
+        config["index_type"] = args.index_type
+    if args.backend:
+        config["inference_backend"] = args.backend
+    settings = index_settings(config)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset_path = args.dataset
+        if args.synthetic:
+            dataset_path = make_synthetic_dataset(os.path.join(tmp, "dataset"), args.synthetic)
+        report = run(dataset_path, args.queries, settings, batch_size=args.batch_size,
+                     num_workers=args.workers, num_results=args.num_results,
+                     sample=args.sample, repeat=args.repeat)
+    report["dataset"] = f"synthetic:{args.synthetic}" if args.synthetic else args.dataset
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
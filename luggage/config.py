@@ -0,0 +1,23 @@
+"""
+Application configuration stored in dataset/app_config.json
+"""
+import json
+import os
+
+CONFIG_PATH = "./dataset/app_config.json"
+
+DEFAULT_CONFIG = {"num_results": 3, "rebuild_index": False, "admin_password": ""}
+
+
+def load_app_config(config_path=CONFIG_PATH):
+    """Load application configuration; raises when the file exists but cannot be parsed"""
+    if os.path.exists(config_path):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return dict(DEFAULT_CONFIG)
+
+
+def save_app_config(config, config_path=CONFIG_PATH):
+    """Save application configuration to JSON file"""
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=4, ensure_ascii=False)
@@ -0,0 +1,148 @@
+"""
+Cached manifest of the dataset folders: article -> images with size and mtime
+
+The admin mutations update the manifest directly. Out-of-band changes are
+picked up by a reconciliation that stats each article folder and only
+rescans (with os.scandir) the folders whose mtime changed, at most once per
+STAT_INTERVAL, so page reruns do not walk the whole dataset.
+"""
+import json
+import os
+import threading
+import time
+
+from luggage.indexing import IMAGE_EXTENSIONS
+
+DATASET_PATH = "dataset"
+MANIFEST_PATH = "cache/dataset_manifest.json"
+
+# Out-of-band changes are noticed after at most this many seconds
+STAT_INTERVAL = 2.0
+
+_lock = threading.Lock()
+# articles: article_id -> {"mtime_ns": folder mtime, "images": {name: [size, mtime_ns]}}
+_state = {"loaded": False, "checked_at": 0.0, "articles": {}}
+
+
+def _load():
+    """Read the persisted manifest once per process; callers must hold _lock"""
+    if _state["loaded"]:
+        return
+    _state["loaded"] = True
+    if os.path.exists(MANIFEST_PATH):
+        try:
+            with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+                _state["articles"] = json.load(f)["articles"]
+        except Exception as e:
+            print(f"Ignoring unreadable dataset manifest {MANIFEST_PATH}: {e}")
+
+
+def _save():
+    """Persist the manifest; callers must hold _lock"""
+    try:
+        os.makedirs(os.path.dirname(MANIFEST_PATH), exist_ok=True)
+        tmp_path = f"{MANIFEST_PATH}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"articles": _state["articles"]}, f, ensure_ascii=False)
+        os.replace(tmp_path, MANIFEST_PATH)
+    except OSError as e:
+        print(f"Could not save the dataset manifest: {e}")
+
+
+def _scan_article(folder, mtime_ns):
+    """List the images of an article folder"""
+    images = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(IMAGE_EXTENSIONS) or not entry.is_file():
+                continue
+            stat = entry.stat()
+            images[entry.name] = [stat.st_size, stat.st_mtime_ns]
+    return {"mtime_ns": mtime_ns, "images": images}
+
+
+def _reconcile():
+    """Bring the manifest in line with the folders; callers must hold _lock
+
+    Only folders whose mtime changed are rescanned: adding, removing or
+    renaming a file updates it, rewriting a file in place does not.
+    """
+    articles = _state["articles"]
+    seen = set()
+    changed = False
+    if os.path.isdir(DATASET_PATH):
+        with os.scandir(DATASET_PATH) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                seen.add(entry.name)
+                mtime_ns = entry.stat().st_mtime_ns
+                known = articles.get(entry.name)
+                if known is None or known["mtime_ns"] != mtime_ns:
+                    articles[entry.name] = _scan_article(entry.path, mtime_ns)
+                    changed = True
+    for article_id in [a for a in articles if a not in seen]:
+        del articles[article_id]
+        changed = True
+    if changed:
+        _save()
+
+
+def _refresh():
+    """Load and reconcile the manifest if the last check is older than STAT_INTERVAL; callers must hold _lock"""
+    _load()
+    now = time.monotonic()
+    if now - _state["checked_at"] >= STAT_INTERVAL:
+        _reconcile()
+        _state["checked_at"] = now
+
+
+def dataset_structure():
+    """Return {article_id: sorted image names}"""
+    with _lock:
+        _refresh()
+        return {article_id: sorted(article["images"])
+                for article_id, article in sorted(_state["articles"].items())}
+
+
+def _folder_mtime(article_id):
+    return os.stat(os.path.join(DATASET_PATH, article_id)).st_mtime_ns
+
+
+def record_article(article_id):
+    """Record a newly created, empty article folder"""
+    with _lock:
+        _load()
+        _state["articles"].setdefault(article_id, {"mtime_ns": None, "images": {}})
+        _state["articles"][article_id]["mtime_ns"] = _folder_mtime(article_id)
+        _save()
+
+
+def record_image(article_id, image_name):
+    """Record an image written to an article folder"""
+    stat = os.stat(os.path.join(DATASET_PATH, article_id, image_name))
+    with _lock:
+        _load()
+        article = _state["articles"].setdefault(article_id, {"mtime_ns": None, "images": {}})
+        article["images"][image_name] = [stat.st_size, stat.st_mtime_ns]
+        article["mtime_ns"] = _folder_mtime(article_id)
+        _save()
+
+
+def forget_image(article_id, image_name):
+    """Drop a deleted image"""
+    with _lock:
+        _load()
+        article = _state["articles"].get(article_id)
+        if article is not None:
+            article["images"].pop(image_name, None)
+            article["mtime_ns"] = _folder_mtime(article_id)
+            _save()
+
+
+def forget_article(article_id):
+    """Drop a deleted article folder"""
+    with _lock:
+        _load()
+        if _state["articles"].pop(article_id, None) is not None:
+            _save()
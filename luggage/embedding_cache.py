@@ -0,0 +1,143 @@
+"""
+On-disk store of CLIP image embeddings keyed by image content hash
+"""
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+CACHE_DIR = "cache/embeddings"
+
+# Bump whenever image decoding or preprocessing changes so that embeddings
+# computed by the previous pipeline are not reused
+PREPROCESS_VERSION = 2
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Return the hex SHA-256 digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _atomic_write(path, write):
+    """Write a file through a temporary sibling and rename it into place"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store for one model and preprocessing version
+
+    All embeddings of a model live in a single .npz file so that a warm load is
+    one sequential read. A small stat table (path -> size, mtime, hash) avoids
+    re-hashing files that did not change since the previous run.
+    """
+
+    def __init__(self, model_name, preprocess_version=PREPROCESS_VERSION, cache_dir=CACHE_DIR):
+        safe_name = model_name.replace('/', '-')
+        self.vectors_path = os.path.join(
+            cache_dir, f"{safe_name}-p{preprocess_version}.npz")
+        self.stats_path = os.path.join(cache_dir, "file_hashes.json")
+        self._lock = threading.Lock()
+        self._vectors = {}
+        self._stats = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        """Load embeddings and the stat table from disk if present"""
+        if os.path.exists(self.vectors_path):
+            try:
+                with np.load(self.vectors_path) as data:
+                    for image_hash, vector in zip(data['hashes'], data['vectors']):
+                        self._vectors[str(image_hash)] = vector
+            except Exception as e:
+                print(f"Ignoring unreadable embedding cache {self.vectors_path}: {e}")
+                self._vectors = {}
+        if os.path.exists(self.stats_path):
+            try:
+                with open(self.stats_path, 'r', encoding='utf-8') as f:
+                    self._stats = json.load(f)
+            except Exception:
+                self._stats = {}
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def file_hash(self, path):
+        """Return the content hash of a file, reusing it when size and mtime are unchanged"""
+        stat = os.stat(path)
+        known = self._stats.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        image_hash = file_sha256(path)
+        with self._lock:
+            self._stats[path] = [stat.st_size, stat.st_mtime_ns, image_hash]
+            self._dirty = True
+        return image_hash
+
+    def stat_entry(self, path):
+        """Return [size, mtime_ns, hash] of a file, hashing it only if it changed"""
+        image_hash = self.file_hash(path)
+        return list(self._stats.get(path, (None, None, image_hash)))
+
+    def record_stat(self, path, entry):
+        """Record a [size, mtime_ns, hash] entry computed elsewhere, e.g. by a worker process"""
+        with self._lock:
+            if self._stats.get(path) != list(entry):
+                self._stats[path] = list(entry)
+                self._dirty = True
+
+    def get(self, image_hash):
+        """Return the cached embedding for a content hash, or None"""
+        return self._vectors.get(image_hash)
+
+    def put(self, image_hash, embedding):
+        """Store the embedding of a content hash"""
+        with self._lock:
+            self._vectors[image_hash] = np.asarray(
+                embedding, dtype='float32').reshape(-1)
+            self._dirty = True
+
+    def save(self, keep_hashes=None):
+        """Persist the cache, optionally dropping hashes that are no longer used"""
+        with self._lock:
+            if keep_hashes is not None:
+                keep_hashes = set(keep_hashes)
+                stale = [h for h in self._vectors if h not in keep_hashes]
+                for image_hash in stale:
+                    del self._vectors[image_hash]
+                self._stats = {path: entry for path, entry in self._stats.items()
+                               if entry[2] in keep_hashes}
+                self._dirty = self._dirty or bool(stale)
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.vectors_path), exist_ok=True)
+            hashes = list(self._vectors)
+            if hashes:
+                vectors = np.vstack([self._vectors[h] for h in hashes])
+            else:
+                vectors = np.zeros((0, 0), dtype='float32')
+            _atomic_write(self.vectors_path, lambda f: np.savez(
+                f, hashes=np.array(hashes), vectors=vectors))
+            stats = json.dumps(self._stats).encode('utf-8')
+            _atomic_write(self.stats_path, lambda f: f.write(stats))
+            self._dirty = False
+
+
+def get_embedding_cache(model_name):
+    """Return the process-wide cache of a model so that concurrent writers share one store"""
+    with _shared_caches_lock:
+        if model_name not in _shared_caches:
+            _shared_caches[model_name] = EmbeddingCache(model_name)
+        return _shared_caches[model_name]
@@ -0,0 +1,212 @@
+"""
+Search engine shared by both pages: model loading, preprocessing, indexing and querying
+
+State lives at module level, so a process serving both pages holds one CLIP
+model per backend and one index, and both pages compute identical embeddings.
+"""
+import threading
+import time
+
+from PIL import Image
+
+from luggage import live_index
+from luggage.artifact import is_stale, load_artifact, save_artifact
+from luggage.backends import model_key
+from luggage.embedding_cache import get_embedding_cache
+from luggage.index_factory import (build_settings, index_settings,
+                                   inference_backend)
+from luggage.images import MODEL_INPUT_SIZE
+from luggage.indexing import (DEFAULT_BATCH_SIZE, MODEL_NAME, build_index_data,
+                              embed_images, list_dataset_images, load_clip)
+from luggage.inference import (DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS,
+                               get_batching_encoder)
+from luggage.metrics import INDEX_STAGE_SECONDS, QUERY_CACHE, QUERY_STAGE_SECONDS
+from luggage.parallel_indexing import build_index_data_sharded
+from luggage.pixel_cache import get_pixel_cache
+from luggage.query_cache import query_embeddings, search_results
+
+_models = {}
+_models_lock = threading.Lock()
+
+current_index = live_index.current_index
+rebuild_status = live_index.rebuild_status
+
+
+def load_model(backend="fp32"):
+    """Load CLIP once per process and backend; return image encoder, preprocess function, and device"""
+    with _models_lock:
+        if backend not in _models:
+            _models[backend] = load_clip(MODEL_NAME, backend=backend)
+        return _models[backend]
+
+
+def start_rebuild(config):
+    """Start rebuilding the index in the background worker, encoding only images missing from the embedding cache"""
+    settings = index_settings(config)
+    backend = inference_backend(settings)
+    key = model_key(MODEL_NAME, backend)
+
+    def build(progress):
+        batch_size = config.get('index_batch_size', DEFAULT_BATCH_SIZE)
+        if config.get('index_shards', 1) > 1:
+            # Worker processes load their own model copies
+            article_ids, image_paths, embeddings, failures, stats = build_index_data_sharded(
+                backend, shards=config['index_shards'], batch_size=batch_size,
+                threads_per_shard=config.get('index_workers'), progress=progress,
+                use_pixel_cache=bool(config.get('pixel_cache')))
+        else:
+            model, preprocess, device = load_model(backend)
+            article_ids, image_paths, embeddings, failures, stats = build_index_data(
+                model, preprocess, device, cache=get_embedding_cache(key),
+                batch_size=batch_size, num_workers=config.get('index_workers'),
+                progress=progress,
+                pixel_cache=get_pixel_cache() if config.get('pixel_cache') else None)
+        for image_path, error in failures:
+            print(f"Error while processing {image_path}: {error}")
+        if not article_ids:
+            return None
+        print(f"Indexed {stats['images']} images ({stats['cached']} cached, {stats['encoded']} encoded "
+              f"at {stats['images_per_sec']:.1f} images/sec) in {stats['seconds']:.1f}s")
+        return article_ids, image_paths, embeddings, settings
+
+    def save(handle):
+        # Persist the new generation so the next restart loads it instantly
+        cache = get_embedding_cache(key)
+        file_hashes = {}
+        for image_path in handle.labels.image_paths():
+            try:
+                file_hashes[image_path] = cache.file_hash(image_path)
+            except OSError:
+                pass  # deleted meanwhile; the artifact will be found stale
+        try:
+            with INDEX_STAGE_SECONDS.time(stage="artifact"):
+                save_artifact(handle.index, handle.labels, file_hashes, key,
+                              settings=handle.settings)
+        except Exception as e:
+            print(f"Could not save the index artifact: {e}")
+
+    return live_index.start_rebuild(build, on_publish=save)
+
+
+def load_index_artifact(config):
+    """Serve the on-disk index artifact if present, refreshing it in the background when the dataset changed"""
+    configured = index_settings(config)
+    artifact = load_artifact(model_key(MODEL_NAME, inference_backend(configured)))
+    if artifact is None:
+        return False
+    index, labels, manifest = artifact
+    built_with = build_settings(manifest.get("index_settings"))
+    # Search-time parameters follow the config, the rest must match how the index was built
+    handle = live_index.publish_faiss_index(index, labels, {**configured, **built_with})
+    print(f"Loaded index artifact built at {manifest['created_at']} ({handle.ntotal} vectors)")
+    if (built_with != build_settings(configured)
+            or is_stale(manifest, [image_path for _, image_path in list_dataset_images()])):
+        start_rebuild(config)
+    return True
+
+
+def ensure_index(config):
+    """Return the current index, loading the artifact or starting the first build if there is none"""
+    handle = current_index()
+    if handle is None and load_index_artifact(config):
+        handle = current_index()
+    if handle is None and not rebuild_status()["running"]:
+        start_rebuild(config)
+    return handle
+
+
+def settings_changed(config):
+    """Return True when the config asks for an index type or backend other than the current index"""
+    handle = current_index()
+    return (handle is not None
+            and build_settings(handle.settings) != build_settings(index_settings(config)))
+
+
+def _encode_query(image, backend, config):
+    """Encode an uploaded image, batched with the queries of concurrent sessions"""
+    model, preprocess, device = load_model(backend)
+    encoder = get_batching_encoder(
+        model, device,
+        max_batch_size=config.get('inference_max_batch', DEFAULT_MAX_BATCH_SIZE),
+        max_wait_ms=config.get('inference_max_wait_ms', DEFAULT_MAX_WAIT_MS))
+    with QUERY_STAGE_SECONDS.time(stage="preprocess"):
+        tensor = preprocess(image)
+    with QUERY_STAGE_SECONDS.time(stage="encode"):
+        return encoder.encode(tensor)
+
+
+def warm_up(config):
+    """Load the index and the query model, then run a dummy query; return False when no index could be built
+
+    Blocks until the first build finishes, so the first visitor gets a warm
+    process. The dummy query bypasses the query caches.
+    """
+    handle = ensure_index(config)
+    while handle is None and rebuild_status()["running"]:
+        time.sleep(0.5)
+        handle = current_index()
+    if handle is None:
+        return False
+    dummy = Image.new("RGB", (MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), (128, 128, 128))
+    q_emb = _encode_query(dummy, inference_backend(handle.settings), config)
+    handle.search_articles(q_emb, config.get('num_results', 3))
+    return True
+
+
+def search(image_hash, image, num_results, config):
+    """Return the closest distinct articles of an upload, reusing cached embeddings and results"""
+    # Pick up the latest published generation
+    handle = current_index()
+    result_key = (image_hash, handle.generation, num_results)
+    sorted_results = search_results.get(result_key)
+    QUERY_CACHE.inc(cache="results", result="miss" if sorted_results is None else "hit")
+    if sorted_results is not None:
+        return sorted_results
+
+    # Queries must be encoded by the backend the index was built with
+    backend = inference_backend(handle.settings)
+    q_emb = query_embeddings.get((image_hash, backend))
+    QUERY_CACHE.inc(cache="embeddings", result="miss" if q_emb is None else "hit")
+    if q_emb is None:
+        q_emb = _encode_query(image, backend, config)
+        query_embeddings.put((image_hash, backend), q_emb)
+
+    # Search the N most similar distinct articles
+    sorted_results = handle.search_articles(q_emb, num_results)
+    search_results.put(result_key, sorted_results)
+    return sorted_results
+
+
+def index_images(article_id, image_paths):
+    """Encode newly added images and append them to the live index; return (image_path, error) failures
+
+    Pass every image of an upload at once: they are encoded in batches and
+    published as a single generation. Their embeddings stay in the
+    in-memory cache and are written to disk by the next rebuild, so an
+    upload does not rewrite the whole embedding file.
+    """
+    handle = current_index()
+    if handle is None:
+        # No index built yet: the next build will pick the images up
+        return []
+    # Encode with the backend the live index was built with
+    backend = inference_backend(handle.settings)
+    model, preprocess, device = load_model(backend)
+    cache = get_embedding_cache(model_key(MODEL_NAME, backend))
+    embeddings, kept, failures, _ = embed_images(
+        image_paths, model, preprocess, device, cache=cache)
+    if kept:
+        with INDEX_STAGE_SECONDS.time(stage="add"):
+            live_index.add_images([article_id] * len(kept),
+                                  [image_paths[i] for i in kept], embeddings)
+    return failures
+
+
+def remove_images(image_paths):
+    """Remove deleted images from the live index"""
+    live_index.remove_images(image_paths)
+
+
+def remove_article(article_id):
+    """Remove every image of a deleted article from the live index"""
+    live_index.remove_article(article_id)
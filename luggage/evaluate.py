@@ -0,0 +1,169 @@
+"""
+Retrieval quality versus speed of the engine configurations
+
+Usage: python -m luggage.evaluate [--index-types flat hnsw ivfpq] [--backends fp32 int8]
+
+Holds out images of every article folder of the dataset, indexes the other
+images and queries the held-out ones. Article-level recall@1/@3/@N is
+computed with the aggregation of the Accueil page (closest distinct
+articles), next to query latency, model and index size and the resident
+memory of each configuration.
+"""
+import argparse
+import io
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+
+from luggage.backends import BACKENDS, model_key
+from luggage.bench import (index_size_bytes, model_size_bytes, percentiles,
+                           rss_mb)
+from luggage.config import CONFIG_PATH, load_app_config
+from luggage.embedding_cache import get_embedding_cache
+from luggage.images import load_image
+from luggage.index_factory import INDEX_TYPES, index_settings
+from luggage.indexing import (DEFAULT_BATCH_SIZE, MODEL_NAME, embed_images,
+                              list_dataset_images, load_clip)
+from luggage.labels import LabelTable
+from luggage.live_index import IndexHandle, create_index
+from luggage.pixel_cache import get_pixel_cache
+
+DEFAULT_RECALL_AT = (1, 3, 10)
+
+
+def split_holdout(images, holdout=1, seed=0):
+    """Split (article_id, image_path) pairs into (indexed, queries)
+
+    holdout images of every article with more than holdout images become
+    queries; articles with fewer images are only indexed.
+    """
+    by_article = defaultdict(list)
+    for article_id, image_path in images:
+        by_article[article_id].append(image_path)
+    rng = random.Random(seed)
+    indexed, queries = [], []
+    for article_id in sorted(by_article):
+        image_paths = by_article[article_id]
+        held_out = set(rng.sample(image_paths, holdout)) if len(image_paths) > holdout else set()
+        for image_path in image_paths:
+            (queries if image_path in held_out else indexed).append((article_id, image_path))
+    return indexed, queries
+
+
+def encode_latency(image_paths, model, preprocess, device):
+    """Time decode + preprocess + encode of single uploads, as on the Accueil page"""
+    import torch
+
+    samples = []
+    for image_path in image_paths:
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        start = time.perf_counter()
+        tensor = preprocess(load_image(io.BytesIO(data))).unsqueeze(0).to(device)
+        with torch.no_grad():
+            model.encode_image(tensor)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def evaluate_index(settings, indexed, index_embeddings, queries, query_embeddings, recall_at):
+    """Build one index configuration and query it; return its report"""
+    start = time.perf_counter()
+    index = create_index(index_embeddings, settings)
+    build_seconds = time.perf_counter() - start
+    handle = IndexHandle(index, LabelTable.from_paths(*zip(*indexed)), 1, settings)
+
+    hits = {n: 0 for n in recall_at}
+    latencies = []
+    for (article_id, _), query in zip(queries, query_embeddings):
+        start = time.perf_counter()
+        results = handle.search_articles(query.reshape(1, -1), max(recall_at))
+        latencies.append(time.perf_counter() - start)
+        found = [result_id for result_id, _ in results]
+        for n in recall_at:
+            hits[n] += article_id in found[:n]
+
+    return {
+        "settings": settings,
+        "recall": {f"@{n}": hits[n] / len(queries) for n in recall_at},
+        "search": percentiles(latencies),
+        "build_seconds": build_seconds,
+        "index_size_bytes": index_size_bytes(index),
+        # Measured while the index is alive; unlike the peak, not inherited from earlier configurations
+        "rss_mb": rss_mb(),
+    }
+
+
+def run(dataset_path, config, index_types, backends, holdout=1, recall_at=DEFAULT_RECALL_AT,
+        latency_sample=20, batch_size=DEFAULT_BATCH_SIZE, seed=0, pixel_cache=None):
+    """Evaluate every (backend, index type) pair; return a list of reports"""
+    indexed, queries = split_holdout(list_dataset_images(dataset_path), holdout, seed)
+    if not indexed or not queries:
+        raise ValueError(f"{dataset_path} needs articles with more than {holdout} image(s)")
+
+    reports = []
+    for backend in backends:
+        model, preprocess, device = load_clip(MODEL_NAME, backend=backend)
+        cache = get_embedding_cache(model_key(MODEL_NAME, backend))
+        embeddings = {}
+        for name, images in (("indexed", indexed), ("queries", queries)):
+            vectors, kept, failures, _ = embed_images(
+                [image_path for _, image_path in images], model, preprocess, device,
+                cache=cache, batch_size=batch_size, pixel_cache=pixel_cache)
+            for image_path, error in failures:
+                print(f"Error while processing {image_path}: {error}", file=sys.stderr)
+            embeddings[name] = ([images[i] for i in kept], vectors)
+        cache.save()
+
+        sample = random.Random(seed).sample(queries, min(latency_sample, len(queries)))
+        encode = percentiles(encode_latency([image_path for _, image_path in sample],
+                                            model, preprocess, device))
+        model_bytes = model_size_bytes(model)
+        for index_type in index_types:
+            settings = index_settings({**config, "index_type": index_type,
+                                       "inference_backend": backend})
+            report = evaluate_index(settings, *embeddings["indexed"], *embeddings["queries"], recall_at)
+            report["encode"] = encode
+            report["queries"] = len(embeddings["queries"][0])
+            report["model_size_bytes"] = model_bytes
+            reports.append(report)
+        # Free this backend's model before loading the next one
+        del model, preprocess
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and speed of engine configurations")
+    parser.add_argument("--dataset", default="dataset/")
+    parser.add_argument("--config", default=CONFIG_PATH)
+    parser.add_argument("--index-types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=["fp32"])
+    parser.add_argument("--holdout", type=int, default=1, help="held-out images per article")
+    parser.add_argument("--recall-at", type=int, nargs="+", default=list(DEFAULT_RECALL_AT))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pixel-cache", action="store_true",
+                        help="reuse decoded 224x224 images across backends instead of decoding every JPEG")
+    parser.add_argument("--output", help="also write the JSON reports to this file")
+    args = parser.parse_args(argv)
+
+    reports = run(args.dataset, load_app_config(args.config), args.index_types, args.backends,
+                  holdout=args.holdout, recall_at=sorted(args.recall_at), seed=args.seed,
+                  pixel_cache=get_pixel_cache() if args.pixel_cache else None)
+    for report in reports:
+        settings = report["settings"]
+        recall = " ".join(f"R{n}={value:.3f}" for n, value in report["recall"].items())
+        print(f"{settings['inference_backend']:>11} {settings['index_type']:>6}  {recall}  "
+              f"search p50={report['search']['p50_ms']:.2f}ms p99={report['search']['p99_ms']:.2f}ms  "
+              f"encode p50={report['encode']['p50_ms']:.1f}ms  "
+              f"visual={report['model_size_bytes'] / 1e6:.0f}MB index={report['index_size_bytes'] / 1e6:.1f}MB "
+              f"rss={report['rss_mb']:.0f}MB")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
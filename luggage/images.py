@@ -0,0 +1,22 @@
+"""
+Shared image loading for uploads, admin thumbnails and indexing
+"""
+from PIL import Image, ImageOps
+
+# CLIP ViT-B/32 input resolution
+MODEL_INPUT_SIZE = 224
+
+
+def load_image(source, size=MODEL_INPUT_SIZE):
+    """Decode an image path or file object to an upright RGB image
+
+    JPEGs are decoded in draft mode, which lets libjpeg scale by 1/2, 1/4 or
+    1/8 while decoding; the scale keeps both sides at least `size` pixels, so
+    a 12 MP phone photo is decoded at roughly 500x380 instead of 4032x3024.
+    EXIF orientation is applied afterwards. Pass size=None for full resolution.
+    """
+    image = Image.open(source)
+    if size and image.format == 'JPEG':
+        image.draft('RGB', (size, size))
+    image = ImageOps.exif_transpose(image)
+    return image.convert('RGB')
@@ -0,0 +1,69 @@
+"""
+Check that the modules imported by the pages stay free of ML libraries
+
+Usage: python -m luggage.import_budget [--budget SECONDS]
+
+Each module is imported in a fresh interpreter; the check fails when it pulls
+in torch, clip or faiss, or when its import time exceeds the budget.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+PAGE_MODULES = ("luggage.config", "luggage.metadata", "luggage.images",
+                "luggage.query_cache", "luggage.thumbnails", "luggage.dataset_manifest",
+                "luggage.engine")
+HEAVY_MODULES = ("torch", "clip", "faiss")
+DEFAULT_BUDGET = 1.0
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+__import__({module!r})
+print(json.dumps({{"seconds": time.perf_counter() - start,
+                  "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module):
+    """Import module in a fresh interpreter; return (seconds, heavy modules loaded)
+
+    Raises ImportError with the child's last error line when the import fails.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, check=False)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise ImportError(lines[-1] if lines else f"cannot import {module}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report["seconds"], report["heavy"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the import cost of the page modules")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET,
+                        help="maximum import time of each module in seconds")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in PAGE_MODULES:
+        try:
+            seconds, heavy = measure(module)
+        except ImportError as e:
+            failed = True
+            print(f"{module}: import failed ({e})")
+            continue
+        problems = []
+        if heavy:
+            problems.append(f"imports {', '.join(heavy)}")
+        if seconds > args.budget:
+            problems.append(f"over the {args.budget:.2f}s budget")
+        failed = failed or bool(problems)
+        print(f"{module}: {seconds:.3f}s" + (f" ({'; '.join(problems)})" if problems else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
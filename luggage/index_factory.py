@@ -0,0 +1,117 @@
+"""
+FAISS index types selectable from app_config.json
+
+    "index_type": "flat" (exact), "hnsw" or "ivfpq"
+    "index_metric": "l2" or "cosine" (L2 on normalized vectors, same ranking as cosine)
+    "hnsw_m", "hnsw_ef_construction", "hnsw_ef_search"
+    "ivf_nlist", "ivf_nprobe", "pq_m", "pq_nbits"
+    "inference_backend": see luggage.backends; embeddings depend on it, so it
+                         is recorded with the index like the settings above
+
+faiss is imported by the functions that build or tune an index, so reading
+the settings stays cheap.
+"""
+import numpy as np
+
+DEFAULT_INDEX_SETTINGS = {
+    "index_type": "flat",
+    "index_metric": "l2",
+    "hnsw_m": 32,
+    "hnsw_ef_construction": 200,
+    "hnsw_ef_search": 64,
+    "ivf_nlist": 256,
+    "ivf_nprobe": 16,
+    "pq_m": 32,
+    "pq_nbits": 8,
+    "inference_backend": "fp32",
+}
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+
+# FAISS recommends at least this many training points per IVF list
+MIN_POINTS_PER_LIST = 39
+
+
+def index_settings(config):
+    """Extract the index settings from the app config, filling in defaults"""
+    settings = {key: config.get(key, default) for key, default in DEFAULT_INDEX_SETTINGS.items()}
+    if settings["index_type"] not in INDEX_TYPES:
+        print(f"Unknown index_type {settings['index_type']!r}, using flat")
+        settings["index_type"] = "flat"
+    return settings
+
+
+def build_settings(settings):
+    """Settings that change the index content, as opposed to search-time parameters"""
+    settings = settings or DEFAULT_INDEX_SETTINGS
+    return {key: value for key, value in settings.items()
+            if key not in ("hnsw_ef_search", "ivf_nprobe")}
+
+
+def inference_backend(settings):
+    """Return the inference backend an index was built with"""
+    return (settings or DEFAULT_INDEX_SETTINGS).get("inference_backend", "fp32")
+
+
+def prepare_vectors(vectors, settings):
+    """Return float32 vectors, L2-normalized when the cosine metric is selected"""
+    vectors = np.array(vectors, dtype='float32', copy=True).reshape(len(vectors), -1)
+    if settings and settings.get("index_metric") == "cosine":
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.maximum(norms, np.finfo('float32').tiny)
+    return vectors
+
+
+def _base_index(dimension, num_vectors, settings):
+    """Create the untrained base index described by settings"""
+    import faiss
+
+    index_type = settings["index_type"]
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, int(settings["hnsw_m"]))
+        index.hnsw.efConstruction = int(settings["hnsw_ef_construction"])
+        return index
+    if index_type == "ivfpq":
+        nlist = max(1, min(int(settings["ivf_nlist"]), num_vectors // MIN_POINTS_PER_LIST))
+        quantizer = faiss.IndexFlatL2(dimension)
+        pq_nbits = int(settings["pq_nbits"])
+        if num_vectors < 2 ** pq_nbits or dimension % int(settings["pq_m"]):
+            # Too few points to train the product quantizer: keep full vectors in the lists
+            print(f"Not enough vectors for PQ ({num_vectors}), using IVF-Flat with {nlist} lists")
+            return faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        return faiss.IndexIVFPQ(quantizer, dimension, nlist, int(settings["pq_m"]), pq_nbits)
+    return faiss.IndexFlatL2(dimension)
+
+
+def apply_search_params(index, settings):
+    """Set search-time parameters such as efSearch and nprobe"""
+    if not settings:
+        return
+    import faiss
+
+    params = faiss.ParameterSpace()
+    if settings["index_type"] == "hnsw":
+        params.set_index_parameter(index, "efSearch", int(settings["hnsw_ef_search"]))
+    elif settings["index_type"] == "ivfpq":
+        params.set_index_parameter(index, "nprobe", int(settings["ivf_nprobe"]))
+
+
+def build_index(vectors, settings, vector_ids=None):
+    """Train an id-mapped index of the configured type and add vectors (already prepared)
+
+    IVF indexes store the vector ids in their inverted lists. They are not
+    wrapped in an IndexIDMap2, whose remove_ids compacts its id table as if
+    the inner index renumbered its vectors, which IVF does not.
+    """
+    import faiss
+
+    settings = settings or DEFAULT_INDEX_SETTINGS
+    base = _base_index(vectors.shape[1], len(vectors), settings)
+    if not base.is_trained:
+        base.train(vectors)  # pylint: disable=no-value-for-parameter
+    index = base if settings["index_type"] == "ivfpq" else faiss.IndexIDMap2(base)
+    if vector_ids is None:
+        vector_ids = np.arange(len(vectors), dtype='int64')
+    index.add_with_ids(vectors, vector_ids)  # pylint: disable=no-value-for-parameter
+    apply_search_params(index, settings)
+    return index
@@ -0,0 +1,77 @@
+"""
+Command-line indexer that writes the search index artifact without Streamlit
+
+Usage: python -m luggage.indexer [--dataset dataset/] [--output cache/index]
+"""
+import argparse
+import sys
+
+from luggage.artifact import ARTIFACT_DIR, save_artifact
+from luggage.backends import model_key
+from luggage.config import CONFIG_PATH, load_app_config
+from luggage.embedding_cache import get_embedding_cache
+from luggage.index_factory import INDEX_TYPES, index_settings, inference_backend
+from luggage.indexing import (DEFAULT_BATCH_SIZE, MODEL_NAME, build_index_data,
+                              load_clip)
+from luggage.labels import LabelTable
+from luggage.live_index import create_index
+from luggage.parallel_indexing import build_index_data_sharded
+from luggage.pixel_cache import get_pixel_cache
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the search index artifact offline")
+    parser.add_argument("--dataset", default="dataset/", help="dataset folder (one sub-folder per article)")
+    parser.add_argument("--output", default=ARTIFACT_DIR, help="artifact output folder")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="decoding threads (default: all cores, divided between shards)")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="worker processes, each encoding a share of the article folders")
+    parser.add_argument("--pixel-cache", action="store_true",
+                        help="keep decoded 224x224 images in cache/pixels so re-encoding skips JPEG decoding")
+    parser.add_argument("--config", default=CONFIG_PATH, help="app config holding the index settings")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, help="override index_type from the config")
+    args = parser.parse_args(argv)
+
+    config = load_app_config(args.config)
+    if args.index_type:
+        config["index_type"] = args.index_type
+    settings = index_settings(config)
+
+    backend = inference_backend(settings)
+    cache = get_embedding_cache(model_key(MODEL_NAME, backend))
+
+    def progress(done, total):
+        print(f"\rEncoding {done}/{total}", end="", flush=True)
+
+    if args.shards > 1:
+        article_ids, image_paths, embeddings, failures, stats = build_index_data_sharded(
+            backend, dataset_path=args.dataset, shards=args.shards, batch_size=args.batch_size,
+            threads_per_shard=args.workers, progress=progress, use_pixel_cache=args.pixel_cache)
+    else:
+        model, preprocess, device = load_clip(MODEL_NAME, backend=backend)
+        article_ids, image_paths, embeddings, failures, stats = build_index_data(
+            model, preprocess, device, cache=cache, dataset_path=args.dataset,
+            batch_size=args.batch_size, num_workers=args.workers, progress=progress,
+            pixel_cache=get_pixel_cache() if args.pixel_cache else None)
+    print()
+    for image_path, error in failures:
+        print(f"Error while processing {image_path}: {error}", file=sys.stderr)
+    if not article_ids:
+        print("No valid image found in the dataset", file=sys.stderr)
+        return 1
+
+    index = create_index(embeddings, settings)
+    manifest = save_artifact(
+        index, LabelTable.from_paths(article_ids, image_paths),
+        {image_path: cache.file_hash(image_path) for image_path in image_paths},
+        model_key(MODEL_NAME, backend), settings=settings, output_dir=args.output)
+    print(f"Indexed {stats['images']} images ({stats['cached']} cached, {stats['encoded']} encoded "
+          f"at {stats['images_per_sec']:.1f} images/sec) in {stats['seconds']:.1f}s")
+    print(f"Wrote {manifest['ntotal']} vectors ({settings['index_type']}, {settings['index_metric']}) to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
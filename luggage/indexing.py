@@ -0,0 +1,220 @@
+"""
+Batched, multi-threaded image encoding used to build the search index
+
+torch and clip are imported by the functions that load or run the model, so
+listing the dataset or reading MODEL_NAME does not pay their import cost.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from luggage.backends import load_backend
+from luggage.images import load_image
+from luggage.metrics import INDEX_STAGE_SECONDS, INDEXED_IMAGES
+from luggage.packed_store import open_image
+
+MODEL_NAME = "ViT-B/32"
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff')
+DEFAULT_BATCH_SIZE = 32
+# Local weights file (baked into the Docker image) used instead of downloading MODEL_NAME
+MODEL_PATH_ENV = "CLIP_MODEL_PATH"
+
+
+def model_source(model_name=MODEL_NAME):
+    """Return the local weights file configured for model_name, or model_name itself"""
+    model_path = os.environ.get(MODEL_PATH_ENV)
+    if model_name == MODEL_NAME and model_path and os.path.exists(model_path):
+        return model_path
+    return model_name
+
+
+def load_clip(model_name=MODEL_NAME, backend="fp32"):
+    """Load a CLIP model and return image encoder, preprocess function, and device
+
+    The encoder exposes encode_image(); with a non-fp32 backend it holds
+    only the (quantized or traced) visual tower.
+    """
+    import clip
+    import torch
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model, preprocess = clip.load(model_source(model_name), device=device)
+    return load_backend(model, device, backend), preprocess, device
+
+
+def list_dataset_images(dataset_path="dataset/"):
+    """Return (article_id, image_path) pairs for every image of the dataset"""
+    images = []
+    if not os.path.exists(dataset_path):
+        return images
+    for article_id in sorted(os.listdir(dataset_path)):
+        folder = os.path.join(dataset_path, article_id)
+        if not os.path.isdir(folder):
+            continue
+        for file in sorted(os.listdir(folder)):
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                images.append((article_id, os.path.join(folder, file)))
+    return images
+
+
+def _load_and_preprocess(image_path, preprocess, image_hash=None, pixel_cache=None):
+    """Decode one image, from the packed store when available, and turn it into a model input tensor
+
+    With a pixel cache and the image hash, the cropped pixels are read from
+    the cache, and only decoded from the file (then cached) on a miss.
+    """
+    if pixel_cache is not None and image_hash is not None:
+        return preprocess(pixel_cache.load(image_hash, lambda: open_image(image_path)))
+    with open_image(image_path) as f:
+        return preprocess(load_image(f))
+
+
+def encode_images(image_paths, model, preprocess, device, batch_size=DEFAULT_BATCH_SIZE,
+                  num_workers=None, progress=None, hashes=None, pixel_cache=None):
+    """Encode images with CLIP, decoding the next batch in a thread pool while the current one is encoded
+
+    Returns (embeddings, kept, failures) where kept lists the positions in
+    image_paths that were encoded and failures holds (image_path, error) pairs.
+    hashes (content hashes of image_paths) lets pixel_cache skip decoding.
+    """
+    import torch
+
+    total = len(image_paths)
+    batch_size = max(1, int(batch_size))
+    num_workers = num_workers or os.cpu_count() or 1
+    batches = [range(start, min(start + batch_size, total))
+               for start in range(0, total, batch_size)]
+
+    embeddings = []
+    kept = []
+    failures = []
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        def submit(batch):
+            return [executor.submit(_load_and_preprocess, image_paths[i], preprocess,
+                                    hashes[i] if hashes else None, pixel_cache) for i in batch]
+
+        pending = submit(batches[0]) if batches else []
+        for batch_number, batch in enumerate(batches):
+            futures = pending
+            # Start decoding the next batch before encoding this one
+            if batch_number + 1 < len(batches):
+                pending = submit(batches[batch_number + 1])
+
+            tensors = []
+            for i, future in zip(batch, futures):
+                try:
+                    tensors.append(future.result())
+                    kept.append(i)
+                except Exception as e:
+                    failures.append((image_paths[i], e))
+
+            if tensors:
+                with torch.no_grad():
+                    batch_embeddings = model.encode_image(
+                        torch.stack(tensors).to(device)).float().cpu().numpy()
+                embeddings.append(batch_embeddings)
+
+            if progress:
+                progress(batch[-1] + 1, total)
+
+    if embeddings:
+        embeddings = np.vstack(embeddings).astype('float32')
+    else:
+        embeddings = np.zeros((0, 0), dtype='float32')
+    return embeddings, kept, failures
+
+
+def embed_images(image_paths, model, preprocess, device, cache=None,
+                 batch_size=DEFAULT_BATCH_SIZE, num_workers=None, progress=None, pixel_cache=None):
+    """Return embeddings for image_paths, encoding only those missing from the cache
+
+    Returns (embeddings, kept, failures, stats); stats reports how many images
+    were encoded or served from the cache and the encoding throughput. The
+    pixel cache is keyed by the content hashes of the embedding cache, so it
+    is only used together with one.
+    """
+    start_time = time.perf_counter()
+    num_workers = num_workers or os.cpu_count() or 1
+
+    hashes = [None] * len(image_paths)
+    failures = []
+    if cache is not None:
+        def safe_hash(image_path):
+            try:
+                return cache.file_hash(image_path), None
+            except Exception as e:
+                return None, e
+
+        with INDEX_STAGE_SECONDS.time(stage="hash"), \
+                ThreadPoolExecutor(max_workers=num_workers) as executor:
+            for i, (image_hash, error) in enumerate(executor.map(safe_hash, image_paths)):
+                hashes[i] = image_hash
+                if error is not None:
+                    failures.append((image_paths[i], error))
+
+    vectors = [None] * len(image_paths)
+    to_encode = []
+    for i, image_hash in enumerate(hashes):
+        if cache is not None and image_hash is None:
+            continue
+        cached = cache.get(image_hash) if cache is not None else None
+        if cached is not None:
+            vectors[i] = cached
+        else:
+            to_encode.append(i)
+
+    encode_start = time.perf_counter()
+    encoded, kept, encode_failures = encode_images(
+        [image_paths[i] for i in to_encode], model, preprocess, device,
+        batch_size=batch_size, num_workers=num_workers, progress=progress,
+        hashes=[hashes[i] for i in to_encode], pixel_cache=pixel_cache)
+    encode_seconds = time.perf_counter() - encode_start
+    if pixel_cache is not None:
+        pixel_cache.save()
+    INDEX_STAGE_SECONDS.observe(encode_seconds, stage="encode")
+    failures.extend(encode_failures)
+    for row, position in enumerate(kept):
+        i = to_encode[position]
+        vectors[i] = encoded[row]
+        if cache is not None:
+            cache.put(hashes[i], encoded[row])
+
+    kept = [i for i, vector in enumerate(vectors) if vector is not None]
+    if kept:
+        embeddings = np.vstack([vectors[i] for i in kept]).astype('float32')
+    else:
+        embeddings = np.zeros((0, 0), dtype='float32')
+
+    INDEXED_IMAGES.inc(len(encoded), outcome="encoded")
+    INDEXED_IMAGES.inc(len(kept) - len(encoded), outcome="cached")
+    INDEXED_IMAGES.inc(len(failures), outcome="failed")
+    stats = {
+        "images": len(kept),
+        "encoded": len(encoded),
+        "cached": len(kept) - len(encoded),
+        "failed": len(failures),
+        "seconds": time.perf_counter() - start_time,
+        "images_per_sec": len(encoded) / encode_seconds if encode_seconds > 0 and len(encoded) else 0.0,
+    }
+    return embeddings, kept, failures, stats
+
+
+def build_index_data(model, preprocess, device, cache=None, dataset_path="dataset/",
+                     batch_size=DEFAULT_BATCH_SIZE, num_workers=None, progress=None, pixel_cache=None):
+    """Encode the whole dataset and return (article_ids, image_paths, embeddings, failures, stats)"""
+    images = list_dataset_images(dataset_path)
+    image_paths = [image_path for _, image_path in images]
+    embeddings, kept, failures, stats = embed_images(
+        image_paths, model, preprocess, device, cache=cache,
+        batch_size=batch_size, num_workers=num_workers, progress=progress,
+        pixel_cache=pixel_cache)
+
+    if cache is not None and kept:
+        # Persist new embeddings and forget those of removed images
+        with INDEX_STAGE_SECONDS.time(stage="cache_save"):
+            cache.save(keep_hashes=[cache.file_hash(image_paths[i]) for i in kept])
+
+    article_ids = [images[i][0] for i in kept]
+    return article_ids, [image_paths[i] for i in kept], embeddings, failures, stats
@@ -0,0 +1,93 @@
+"""
+Local inference worker that groups concurrent query images into one CLIP batch
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+DEFAULT_MAX_BATCH_SIZE = 16
+DEFAULT_MAX_WAIT_MS = 10
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+class BatchingEncoder:
+    """Encode preprocessed image tensors through a request queue
+
+    The worker takes the first waiting request, then keeps collecting
+    requests for at most max_wait_ms or until max_batch_size is reached, and
+    runs a single encode_image call for the whole batch. Under load, sessions
+    share one batched forward pass instead of competing for CPU threads with
+    batch size 1; when idle, a request waits at most max_wait_ms extra.
+    """
+
+    def __init__(self, model, device, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.model = model
+        self.device = device
+        self.configure(max_batch_size, max_wait_ms)
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(
+            target=self._run, name="clip-batching-encoder", daemon=True)
+        self._worker.start()
+
+    def configure(self, max_batch_size, max_wait_ms):
+        """Set the batching limits; the worker applies them from its next batch"""
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+
+    def encode(self, image_tensor, timeout=None):
+        """Return the (1, dim) float32 embedding of one preprocessed image tensor"""
+        future = Future()
+        self._requests.put((image_tensor, future))
+        return future.result(timeout)
+
+    def _next_batch(self):
+        """Block for one request, then gather more until the batch is full or the wait expires"""
+        batch = [self._requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        """Worker loop"""
+        import torch
+
+        while True:
+            batch = self._next_batch()
+            try:
+                with torch.no_grad():
+                    embeddings = self.model.encode_image(
+                        torch.stack([tensor for tensor, _ in batch]).to(self.device)
+                    ).float().cpu().numpy()
+                for (_, future), embedding in zip(batch, embeddings):
+                    future.set_result(embedding.reshape(1, -1))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+def get_batching_encoder(model, device, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                         max_wait_ms=DEFAULT_MAX_WAIT_MS):
+    """Return the process-wide encoder of a model, starting its worker on first use
+
+    The batching limits of an existing encoder are updated, so changes to
+    the app config apply without a restart.
+    """
+    with _encoders_lock:
+        encoder = _encoders.get(id(model))
+        if encoder is None:
+            encoder = BatchingEncoder(model, device, max_batch_size, max_wait_ms)
+            _encoders[id(model)] = encoder
+        else:
+            encoder.configure(max_batch_size, max_wait_ms)
+        return encoder
@@ -0,0 +1,121 @@
+"""
+Compact per-vector labels of a search index
+
+Every image path has the dataset layout <root>/<article_id>/<file name>, so a
+vector is described by an int32 article code and its file name: the article
+ids are stored once in a small label table instead of once per vector.
+"""
+import os
+
+import numpy as np
+
+
+def split_path(image_path):
+    """Return (root, article_id, file name) of a dataset image path"""
+    folder, filename = os.path.split(os.path.normpath(image_path))
+    root, article_id = os.path.split(folder)
+    return root, article_id, filename
+
+
+class LabelTable:
+    """Immutable labels of the vectors of an index; vector ids are positions
+
+    codes holds the article code of each vector, -1 for removed vectors,
+    articles maps codes to article ids and filenames holds the file name of
+    each vector (None once removed).
+    """
+
+    def __init__(self, codes, articles, filenames, root):
+        self.codes = np.asarray(codes, dtype='int32')
+        self.articles = tuple(articles)
+        self.filenames = tuple(filenames)
+        self.root = root
+        self._article_codes = {article_id: code for code, article_id in enumerate(self.articles)}
+        if len(self.codes) != len(self.filenames):
+            raise ValueError("codes and filenames must have the same length")
+
+    @classmethod
+    def from_paths(cls, article_ids, image_paths):
+        """Build labels for vectors numbered like image_paths"""
+        return cls(np.zeros(0, dtype='int32'), (), (), None).extended(article_ids, image_paths)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def num_images(self):
+        """Number of vectors that were not removed"""
+        return int(np.count_nonzero(self.codes >= 0))
+
+    def article(self, vector_id):
+        """Return the article id of a vector, or None once removed"""
+        code = self.codes[vector_id]
+        return self.articles[code] if code >= 0 else None
+
+    def path(self, vector_id):
+        """Return the image path of a vector, or None once removed"""
+        code = self.codes[vector_id]
+        if code < 0:
+            return None
+        return os.path.join(self.root, self.articles[code], self.filenames[vector_id])
+
+    def image_paths(self):
+        """Return the paths of the images that were not removed"""
+        return [self.path(i) for i in np.flatnonzero(self.codes >= 0)]
+
+    def vector_ids(self, article_id):
+        """Return the ids of the vectors of an article"""
+        code = self._article_codes.get(article_id)
+        if code is None:
+            return []
+        return [int(i) for i in np.flatnonzero(self.codes == code)]
+
+    def vector_id(self, image_path):
+        """Return the vector id of an image, or None"""
+        root, article_id, filename = split_path(image_path)
+        if root != self.root:
+            return None
+        for i in self.vector_ids(article_id):
+            if self.filenames[i] == filename:
+                return i
+        return None
+
+    def without(self, vector_ids):
+        """Return a copy with the given vectors marked as removed"""
+        codes = self.codes.copy()
+        filenames = list(self.filenames)
+        for vector_id in vector_ids:
+            codes[vector_id] = -1
+            filenames[vector_id] = None
+        return LabelTable(codes, self.articles, filenames, self.root)
+
+    def extended(self, article_ids, image_paths):
+        """Return a copy with new vectors appended, numbered after the existing ones"""
+        articles = list(self.articles)
+        article_codes = dict(self._article_codes)
+        root = self.root
+        codes = []
+        filenames = []
+        for article_id, image_path in zip(article_ids, image_paths):
+            path_root, folder, filename = split_path(image_path)
+            if root is None:
+                root = path_root
+            if path_root != root or folder != article_id:
+                raise ValueError(f"{image_path} is not an image of {article_id} in {root}")
+            if article_id not in article_codes:
+                article_codes[article_id] = len(articles)
+                articles.append(article_id)
+            codes.append(article_codes[article_id])
+            filenames.append(filename)
+        return LabelTable(np.concatenate([self.codes, np.array(codes, dtype='int32')]),
+                          articles, self.filenames + tuple(filenames), root)
+
+    def to_json(self):
+        """Return a JSON-serializable dict"""
+        return {"root": self.root, "articles": list(self.articles),
+                "codes": self.codes.tolist(), "filenames": list(self.filenames)}
+
+    @classmethod
+    def from_json(cls, data):
+        """Rebuild labels written by to_json()"""
+        return cls(data["codes"], data["articles"], data["filenames"], data["root"])
@@ -0,0 +1,308 @@
+"""
+Process-wide search index shared read-only by every Streamlit session
+"""
+import threading
+
+import numpy as np
+
+from luggage.index_factory import (apply_search_params, build_index,
+                                   inference_backend, prepare_vectors)
+from luggage.labels import LabelTable
+from luggage.metrics import (INDEX_IMAGES, INDEX_REBUILDS, INDEX_STAGE_SECONDS,
+                             QUERY_STAGE_SECONDS)
+
+# Neighbours fetched by the first article search; widened until enough distinct articles are found
+ARTICLE_SEARCH_K = 50
+
+_current = None
+_write_lock = threading.Lock()
+
+
+class IndexHandle:
+    """Immutable snapshot of the search index
+
+    Vector ids are positions in the label table. Removed images keep their
+    position with article code -1 so that the ids of the other vectors stay
+    valid. Every update publishes a new handle with the next generation
+    number, so a session holding an older handle can keep searching it safely.
+    """
+
+    def __init__(self, index, labels, generation, settings=None):
+        self.index = index
+        self.labels = labels
+        self.generation = generation
+        self.settings = settings
+
+    @property
+    def codes(self):
+        """Per-vector article codes, -1 for removed vectors"""
+        return self.labels.codes
+
+    @property
+    def articles(self):
+        """Article ids indexed by code"""
+        return self.labels.articles
+
+    @property
+    def ntotal(self):
+        """Number of vectors stored in the FAISS index"""
+        return self.index.ntotal
+
+    @property
+    def num_images(self):
+        """Number of images that can be returned by a search"""
+        return self.labels.num_images
+
+    def vector_id(self, image_path):
+        """Return the vector id of an indexed image, or None"""
+        return self.labels.vector_id(image_path)
+
+    def search(self, query, k):
+        """Search the k nearest vectors; returned ids index the label table"""
+        return self.index.search(  # pylint: disable=no-value-for-parameter
+            prepare_vectors(query, self.settings), k)
+
+    def search_articles(self, query, num_results, k=ARTICLE_SEARCH_K):
+        """Return (article_id, distance) for the num_results closest distinct articles, best first
+
+        The search is widened until it yields num_results distinct articles or
+        covers the whole index, so articles with many near-identical photos
+        cannot crowd the others out.
+        """
+        if self.ntotal == 0:
+            return []
+        k = min(max(k, num_results), self.ntotal)
+        while True:
+            with QUERY_STAGE_SECONDS.time(stage="search"):
+                distances, vector_ids = self.search(query, k)
+            with QUERY_STAGE_SECONDS.time(stage="aggregate"):
+                results = self.aggregate(distances[0], vector_ids[0], num_results)
+            if len(results) >= num_results or k >= self.ntotal:
+                return results
+            k = min(k * 4, self.ntotal)
+
+    def aggregate(self, distances, vector_ids, num_results):
+        """Return (article_id, distance) of the best hit of up to num_results distinct articles, best first"""
+        valid = vector_ids >= 0
+        distances = distances[valid]
+        codes = self.codes[vector_ids[valid]]
+        valid = codes >= 0
+        distances, codes = distances[valid], codes[valid]
+
+        # Best hit of each article: first occurrence once sorted by distance
+        order = np.argsort(distances, kind='stable')
+        _, first = np.unique(codes[order], return_index=True)
+        best = order[np.sort(first)][:num_results]
+        return [(self.articles[codes[i]], float(distances[i])) for i in best]
+
+
+def current_index():
+    """Return the handle shared by every session of this process, or None"""
+    return _current
+
+
+def _publish(index, labels, settings):
+    """Swap in a new handle; callers must hold _write_lock"""
+    global _current
+    generation = _current.generation + 1 if _current is not None else 1
+    _current = IndexHandle(index, labels, generation, settings)
+    INDEX_IMAGES.set(_current.num_images)
+    return _current
+
+
+def create_index(embeddings, settings=None):
+    """Build an id-mapped FAISS index of the configured type whose vector ids are the row numbers of embeddings"""
+    return build_index(prepare_vectors(embeddings, settings), settings)
+
+
+def publish_faiss_index(index, labels, settings=None):
+    """Make an already built index and its label table the current generation"""
+    apply_search_params(index, settings)
+    with _write_lock:
+        return _publish(index, labels, settings)
+
+
+def publish_index(article_ids, image_paths, embeddings, settings=None):
+    """Build a new generation from scratch and make it the current one"""
+    return publish_faiss_index(create_index(embeddings, settings),
+                               LabelTable.from_paths(article_ids, image_paths), settings)
+
+
+def _clone(index):
+    """Return a private, writable copy of a published index
+
+    clone_index would keep pointing at the read-only mapped storage of an
+    index loaded from the artifact, so the copy goes through a serialization.
+    """
+    import faiss
+
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def _remove_from(index, vector_ids):
+    """Remove vectors from a private copy of the index
+
+    Index types without removal support (HNSW) keep the vectors; the removed
+    entries of the label table are skipped when aggregating results.
+    """
+    if vector_ids:
+        try:
+            index.remove_ids(np.array(vector_ids, dtype='int64'))
+        except RuntimeError:
+            pass
+
+
+def _add_to(index, labels, settings, article_ids, image_paths, embeddings):
+    """Add images to a private copy of the index, replacing those already indexed; return the new labels"""
+    replaced = [v for v in map(labels.vector_id, image_paths) if v is not None]
+    _remove_from(index, replaced)
+    start = len(labels)
+    index.add_with_ids(  # pylint: disable=no-value-for-parameter
+        prepare_vectors(embeddings, settings),
+        np.arange(start, start + len(image_paths), dtype='int64'))
+    return labels.without(replaced).extended(article_ids, image_paths)
+
+
+def _log_change(change):
+    """Record a change for the rebuild in progress; callers must hold _write_lock"""
+    if _rebuild_changes is not None:
+        _rebuild_changes.append(change)
+
+
+def add_images(article_ids, image_paths, embeddings):
+    """Publish a new generation with the given images added, replacing images already indexed"""
+    with _write_lock:
+        handle = _current
+        if handle is None:
+            return None
+        index = _clone(handle.index)
+        labels = _add_to(index, handle.labels, handle.settings, article_ids, image_paths, embeddings)
+        _log_change(("add", list(article_ids), list(image_paths), embeddings, handle.settings))
+        return _publish(index, labels, handle.settings)
+
+
+def _publish_without(handle, vector_ids):
+    """Publish a copy of handle without the given vectors; callers must hold _write_lock"""
+    if not vector_ids:
+        return handle
+    index = _clone(handle.index)
+    _remove_from(index, vector_ids)
+    return _publish(index, handle.labels.without(vector_ids), handle.settings)
+
+
+def remove_images(image_paths):
+    """Publish a new generation without the given images"""
+    with _write_lock:
+        _log_change(("remove_images", list(image_paths)))
+        if _current is None:
+            return None
+        return _publish_without(_current, [v for v in map(_current.vector_id, image_paths)
+                                           if v is not None])
+
+
+def remove_article(article_id):
+    """Publish a new generation without any image of an article"""
+    with _write_lock:
+        _log_change(("remove_article", article_id))
+        if _current is None:
+            return None
+        return _publish_without(_current, _current.labels.vector_ids(article_id))
+
+
+_rebuild_lock = threading.Lock()
+_rebuild_thread = None
+_rebuild_status = {"running": False, "done": 0, "total": 0, "error": None}
+# Changes published while a rebuild runs; replayed onto its result so they are not undone
+_rebuild_changes = None
+
+
+def _replay(index, labels, settings, changes):
+    """Apply logged changes to a freshly built index; return (labels, replayed all)
+
+    Images added with another inference backend cannot be replayed: their
+    embeddings do not belong in this index, so the caller builds again.
+    """
+    replayed_all = True
+    for change in changes:
+        if change[0] == "add":
+            _, article_ids, image_paths, embeddings, added_with = change
+            if inference_backend(added_with) != inference_backend(settings):
+                replayed_all = False
+                continue
+            labels = _add_to(index, labels, settings, article_ids, image_paths, embeddings)
+        else:
+            if change[0] == "remove_images":
+                vector_ids = [v for v in map(labels.vector_id, change[1]) if v is not None]
+            else:
+                vector_ids = labels.vector_ids(change[1])
+            _remove_from(index, vector_ids)
+            labels = labels.without(vector_ids)
+    return labels, replayed_all
+
+
+def _run_rebuild(build, on_publish):
+    """Body of the background rebuild worker"""
+    global _rebuild_changes
+
+    def progress(done, total):
+        _rebuild_status["done"] = done
+        _rebuild_status["total"] = total
+
+    try:
+        while True:
+            with _write_lock:
+                _rebuild_changes = []
+            result = build(progress)
+            if result is None:
+                _rebuild_status["error"] = "no valid image in the dataset"
+                INDEX_REBUILDS.inc(result="empty")
+                return
+            article_ids, image_paths, embeddings, settings = result
+            with INDEX_STAGE_SECONDS.time(stage="index"):
+                index = create_index(embeddings, settings)
+                labels = LabelTable.from_paths(article_ids, image_paths)
+                apply_search_params(index, settings)
+            with _write_lock:
+                # Admin changes made since the dataset was listed
+                labels, replayed_all = _replay(index, labels, settings, _rebuild_changes)
+                handle = _publish(index, labels, settings)
+                _rebuild_changes = None
+            INDEX_REBUILDS.inc(result="published")
+            print(f"Index generation {handle.generation} published ({handle.ntotal} vectors)")
+            if replayed_all:
+                break
+            print("Images were added with another inference backend during the rebuild; building again")
+        if on_publish is not None:
+            on_publish(handle)
+    except Exception as e:
+        _rebuild_status["error"] = str(e)
+        INDEX_REBUILDS.inc(result="failed")
+        print(f"Index rebuild failed: {e}")
+    finally:
+        with _write_lock:
+            _rebuild_changes = None
+        _rebuild_status["running"] = False
+
+
+def start_rebuild(build, on_publish=None):
+    """Run build(progress) in the single background worker and publish its result
+
+    build must return (article_ids, image_paths, embeddings, settings) or None. The
+    current generation keeps serving searches until the new one is swapped
+    in, then on_publish(handle) is called. Returns False when a rebuild is
+    already running.
+    """
+    global _rebuild_thread
+    with _rebuild_lock:
+        if _rebuild_thread is not None and _rebuild_thread.is_alive():
+            return False
+        _rebuild_status.update(running=True, done=0, total=0, error=None)
+        _rebuild_thread = threading.Thread(
+            target=_run_rebuild, args=(build, on_publish), name="index-rebuild", daemon=True)
+        _rebuild_thread.start()
+        return True
+
+
+def rebuild_status():
+    """Return a copy of the background rebuild progress"""
+    return dict(_rebuild_status)
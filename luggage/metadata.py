@@ -0,0 +1,79 @@
+"""
+In-memory view of dataset/metadata.json with O(1) lookups by label
+"""
+import json
+import os
+import threading
+import time
+
+METADATA_PATH = "dataset/metadata.json"
+
+# Out-of-band edits of the file are noticed after at most this many seconds
+STAT_INTERVAL = 1.0
+
+NOT_FOUND = "Non trouvé"
+
+_lock = threading.Lock()
+_state = {"signature": None, "checked_at": 0.0, "entries": [], "by_label": {}}
+
+
+def _file_signature(path):
+    """Return (mtime, size) of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _set_entries(entries, signature):
+    """Replace the cached entries; callers must hold _lock"""
+    by_label = {}
+    for entry in entries:
+        # Keep the first entry of a label, like the former linear scan did
+        by_label.setdefault(entry.get("label"), entry)
+    _state.update(signature=signature, checked_at=time.monotonic(),
+                  entries=entries, by_label=by_label)
+
+
+def _refresh():
+    """Reload the file if it changed since the last check; raises on unreadable JSON"""
+    with _lock:
+        now = time.monotonic()
+        if _state["signature"] is not None and now - _state["checked_at"] < STAT_INTERVAL:
+            return
+        signature = _file_signature(METADATA_PATH)
+        if signature == _state["signature"]:
+            _state["checked_at"] = now
+            return
+        entries = []
+        if signature is not None:
+            with open(METADATA_PATH, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        _set_entries(entries, signature)
+
+
+def load_metadata():
+    """Return a copy of the metadata entries that callers may modify"""
+    _refresh()
+    return [dict(entry) for entry in _state["entries"]]
+
+
+def get_article_urls(label):
+    """Get (url-roulette, url-kit) for an article without reading the file again"""
+    _refresh()
+    entry = _state["by_label"].get(label)
+    if entry is None:
+        return NOT_FOUND, NOT_FOUND
+    return entry.get("url-roulette", NOT_FOUND), entry.get("url-kit", NOT_FOUND)
+
+
+def save_metadata(metadata):
+    """Write the metadata file and update the in-memory view"""
+    tmp_path = f"{METADATA_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, METADATA_PATH)
+    with _lock:
+        _set_entries([dict(entry) for entry in metadata],
+                     _file_signature(METADATA_PATH))
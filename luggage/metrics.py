@@ -0,0 +1,142 @@
+"""
+Process-wide counters and latency histograms in the Prometheus text format
+
+The metrics are served on /metrics by luggage.serve. They are kept in memory
+by this module, so the app does not depend on a Prometheus client library.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from a FAISS search on a small index to a full rebuild phase
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+_registry = []
+_lock = threading.Lock()
+
+
+def _format_labels(labelnames, values, extra=()):
+    """Render {name="value",...} for a sample"""
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with _lock:
+            values = dict(self._values)
+        return [(self.name, _format_labels(self.labelnames, key), value)
+                for key, value in sorted(values.items())]
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with _lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Cumulative histogram of observed durations, optionally split by labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with _lock:
+            # One count per bucket followed by the +Inf bucket, i.e. the sample count
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with _lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        samples = []
+        for key, (counts, total) in sorted(values.items()):
+            for bound, count in zip(self.buckets, counts):
+                samples.append((f"{self.name}_bucket",
+                                _format_labels(self.labelnames, key, [("le", repr(float(bound)))]), count))
+            samples.append((f"{self.name}_bucket",
+                            _format_labels(self.labelnames, key, [("le", "+Inf")]), counts[-1]))
+            samples.append((f"{self.name}_sum", _format_labels(self.labelnames, key), total))
+            samples.append((f"{self.name}_count", _format_labels(self.labelnames, key), counts[-1]))
+        return samples
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value}")
+    return "\n".join(lines) + "\n"
+
+
+QUERY_STAGE_SECONDS = Histogram(
+    "luggage_query_stage_seconds",
+    "Time spent in each stage of an image search",
+    ["stage"])
+QUERY_CACHE = Counter(
+    "luggage_query_cache_total",
+    "Lookups of the query embedding and result caches",
+    ["cache", "result"])
+INDEX_STAGE_SECONDS = Histogram(
+    "luggage_index_stage_seconds",
+    "Time spent in each phase of index building and updates",
+    ["stage"])
+INDEXED_IMAGES = Counter(
+    "luggage_indexed_images_total",
+    "Images processed while indexing, by outcome",
+    ["outcome"])
+INDEX_REBUILDS = Counter(
+    "luggage_index_rebuilds_total",
+    "Background index rebuilds, by result",
+    ["result"])
+INDEX_IMAGES = Gauge(
+    "luggage_index_images",
+    "Images searchable in the current index generation")
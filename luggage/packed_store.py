@@ -0,0 +1,217 @@
+"""
+Optional packed copy of the dataset images for fast sequential and mmap reads
+
+Usage: python -m luggage.packed_store [--dataset dataset/] [--output cache/packed] [--max-size 448]
+
+The images are concatenated into a few large shard files, with an offset
+index (index.json) that is written last. Each build writes shard files under
+new names, so the offsets of index.json always match the shards it lists;
+the shards of the previous build are deleted once it is replaced. The per-article folders stay the
+source of truth: an entry is only served while the size and mtime of its
+file are unchanged, otherwise readers fall back to the file itself.
+"""
+import argparse
+import io
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+import uuid
+
+from luggage.images import MODEL_INPUT_SIZE, load_image
+
+PACKED_DIR = "cache/packed"
+INDEX_FILE = "index.json"
+FORMAT_VERSION = 1
+DEFAULT_SHARD_SIZE = 256 * 1024 * 1024
+
+# A rebuilt store is picked up after at most this many seconds
+STAT_INTERVAL = 1.0
+
+
+def _shard_name(build_id, number):
+    return f"shard-{build_id}-{number:05d}.bin"
+
+
+def _remove_stale_shards(output_dir, shards):
+    """Delete the shard files of earlier or interrupted builds"""
+    for name in os.listdir(output_dir):
+        if name.startswith("shard-") and name not in shards:
+            try:
+                os.remove(os.path.join(output_dir, name))
+            except OSError as e:
+                print(f"Could not remove stale shard {name}: {e}")
+
+
+def _resized_bytes(image_path, max_size):
+    """Re-encode an image as an upright JPEG whose longest side is at most max_size"""
+    image = load_image(image_path, size=max_size)
+    image.thumbnail((max_size, max_size))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def build_store(dataset_path="dataset/", output_dir=PACKED_DIR, shard_size=DEFAULT_SHARD_SIZE,
+                max_size=None, progress=None):
+    """Pack every dataset image into shard files; return the offset index
+
+    With max_size, images are stored pre-resized instead of byte for byte;
+    such copies are only served to callers that accept resized images.
+    """
+    if max_size and max_size < MODEL_INPUT_SIZE:
+        raise ValueError(f"max_size must be at least the model input size ({MODEL_INPUT_SIZE})")
+    # Not at module level: luggage.indexing imports this module
+    from luggage.indexing import list_dataset_images
+
+    os.makedirs(output_dir, exist_ok=True)
+    images = list_dataset_images(dataset_path)
+    build_id = uuid.uuid4().hex[:12]
+    entries = {}
+    shard_number, shard, written = 0, None, 0
+    try:
+        for done, (_, image_path) in enumerate(images, 1):
+            try:
+                stat = os.stat(image_path)
+                if max_size:
+                    data = _resized_bytes(image_path, max_size)
+                else:
+                    with open(image_path, 'rb') as f:
+                        data = f.read()
+            except Exception as e:
+                print(f"Skipping {image_path}: {e}")
+                continue
+            if shard is None or (written and written + len(data) > shard_size):
+                if shard is not None:
+                    shard.close()
+                    shard_number += 1
+                shard = open(os.path.join(output_dir, _shard_name(build_id, shard_number)), 'wb')
+                written = 0
+            shard.write(data)
+            entries[os.path.normpath(image_path)] = [shard_number, written, len(data),
+                                                     stat.st_size, stat.st_mtime_ns]
+            written += len(data)
+            if progress:
+                progress(done, len(images))
+    finally:
+        if shard is not None:
+            shard.close()
+
+    shards = [_shard_name(build_id, n) for n in range(shard_number + 1)] if shard is not None else []
+    index = {"format_version": FORMAT_VERSION, "max_size": max_size,
+             "shards": shards, "entries": entries}
+    index_path = os.path.join(output_dir, INDEX_FILE)
+    with open(f"{index_path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(f"{index_path}.tmp", index_path)
+    # Readers that mapped the old shards keep them until they reopen the store
+    _remove_stale_shards(output_dir, shards)
+    return index
+
+
+class PackedStore:
+    """Read-only, memory-mapped view of a packed store"""
+
+    def __init__(self, output_dir=PACKED_DIR):
+        with open(os.path.join(output_dir, INDEX_FILE), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported packed store format in {output_dir}")
+        self.max_size = index.get("max_size")
+        self._entries = index["entries"]
+        self._maps = []
+        for name in index["shards"]:
+            with open(os.path.join(output_dir, name), 'rb') as f:
+                self._maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                                  if os.fstat(f.fileno()).st_size else b"")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def read(self, image_path, stat=None):
+        """Return the stored bytes of an image, or None when missing or out of date"""
+        entry = self._entries.get(os.path.normpath(image_path))
+        if entry is None:
+            return None
+        shard, offset, length, size, mtime_ns = entry
+        try:
+            stat = stat or os.stat(image_path)
+        except OSError:
+            return None
+        if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+            return None
+        return self._maps[shard][offset:offset + length]
+
+
+_lock = threading.Lock()
+_state = {"signature": None, "checked_at": 0.0, "store": None}
+
+
+def get_packed_store(output_dir=PACKED_DIR):
+    """Return the process-wide store, reopened when it is rebuilt, or None when there is none"""
+    with _lock:
+        now = time.monotonic()
+        if now - _state["checked_at"] < STAT_INTERVAL:
+            return _state["store"]
+        _state["checked_at"] = now
+        try:
+            stat = os.stat(os.path.join(output_dir, INDEX_FILE))
+            signature = (output_dir, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        if signature != _state["signature"]:
+            store = None
+            if signature is not None:
+                try:
+                    store = PackedStore(output_dir)
+                except Exception as e:
+                    print(f"Ignoring unreadable packed store in {output_dir}: {e}")
+                    # Retried at the next check, e.g. when a rebuild deleted the shards just read about
+                    signature = None
+            _state.update(signature=signature, store=store)
+        return _state["store"]
+
+
+def open_image(image_path, resized_ok=False):
+    """Return a file object with the image bytes, from the packed store when it holds a current copy
+
+    A store of pre-resized images is only used with resized_ok: embeddings
+    and decoded pixels are cached under the hash of the original file, so
+    the indexer must see the original bytes.
+    """
+    store = get_packed_store()
+    if store is not None and store.max_size and not resized_ok:
+        store = None
+    data = store.read(image_path) if store is not None else None
+    if data is None:
+        return open(image_path, 'rb')
+    return io.BytesIO(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pack the dataset images into shard files")
+    parser.add_argument("--dataset", default="dataset/")
+    parser.add_argument("--output", default=PACKED_DIR)
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE // (1024 * 1024),
+                        help="maximum shard size in MB")
+    parser.add_argument("--max-size", type=int, default=None,
+                        help="store images pre-resized to this longest side instead of the original bytes "
+                             "(served to thumbnails only)")
+    args = parser.parse_args(argv)
+    if args.max_size and args.max_size < MODEL_INPUT_SIZE:
+        parser.error(f"--max-size must be at least {MODEL_INPUT_SIZE}")
+
+    def progress(done, total):
+        print(f"\rPacking {done}/{total}", end="", flush=True)
+
+    index = build_store(args.dataset, args.output, args.shard_size * 1024 * 1024,
+                        args.max_size, progress)
+    print()
+    print(f"Packed {len(index['entries'])} images into {len(index['shards'])} shard(s) in {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
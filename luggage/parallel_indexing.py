@@ -0,0 +1,119 @@
+"""
+Sharded indexing: article folders encoded by several worker processes
+
+Each worker loads its own model copy and limits torch to its share of the
+cores, so decoding and encoding scale with the number of processes instead
+of being bound by one interpreter. Results are merged back in dataset order,
+so the index and label table do not depend on which shard finished first.
+"""
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from luggage.backends import model_key
+from luggage.embedding_cache import get_embedding_cache
+from luggage.indexing import (DEFAULT_BATCH_SIZE, MODEL_NAME, embed_images,
+                              list_dataset_images, load_clip)
+from luggage.pixel_cache import get_pixel_cache
+
+
+def split_articles(images, shards):
+    """Assign whole article folders to shards, balancing image counts; return lists of dataset positions"""
+    by_article = defaultdict(list)
+    for position, (article_id, _) in enumerate(images):
+        by_article[article_id].append(position)
+    # Largest articles first, each to the least loaded shard; ties broken by article id
+    articles = sorted(by_article, key=lambda a: (-len(by_article[a]), a))
+    assignment = [[] for _ in range(shards)]
+    for article_id in articles:
+        shard = min(range(shards), key=lambda s: (len(assignment[s]), s))
+        assignment[shard].extend(by_article[article_id])
+    return [sorted(positions) for positions in assignment if positions]
+
+
+def _embed_shard(image_paths, backend, batch_size, threads, use_pixel_cache=False):
+    """Worker process body: encode one shard; return (kept, embeddings, stat entries, failures, stats)
+
+    The stat entries ([size, mtime_ns, hash] of each kept image) let the
+    parent record the hashes without reading the files again.
+    """
+    import torch
+
+    torch.set_num_threads(threads)
+    model, preprocess, device = load_clip(MODEL_NAME, backend=backend)
+    # Read-only here: the parent stores new embeddings once every shard is done
+    cache = get_embedding_cache(model_key(MODEL_NAME, backend))
+    embeddings, kept, failures, stats = embed_images(
+        image_paths, model, preprocess, device, cache=cache,
+        batch_size=batch_size, num_workers=threads,
+        # Each worker opens the shared store; appends are locked across processes
+        pixel_cache=get_pixel_cache() if use_pixel_cache else None)
+    entries = [cache.stat_entry(image_paths[i]) for i in kept]
+    # Exceptions of decoding libraries do not always pickle
+    failures = [(image_path, str(error)) for image_path, error in failures]
+    return kept, embeddings, entries, failures, stats
+
+
+def build_index_data_sharded(backend="fp32", dataset_path="dataset/", shards=None,
+                             batch_size=DEFAULT_BATCH_SIZE, threads_per_shard=None, progress=None,
+                             use_pixel_cache=False):
+    """Encode the dataset in shards worker processes; return (article_ids, image_paths, embeddings, failures, stats)
+
+    Same result as luggage.indexing.build_index_data with the embedding
+    cache of the backend; progress(done, total) is reported per shard.
+    With use_pixel_cache, the workers read and fill the shared pixel cache.
+    """
+    start_time = time.perf_counter()
+    cpu_count = os.cpu_count() or 1
+    shards = max(1, shards or cpu_count)
+    threads_per_shard = threads_per_shard or max(1, cpu_count // shards)
+
+    images = list_dataset_images(dataset_path)
+    image_paths = [image_path for _, image_path in images]
+    assignment = split_articles(images, shards)
+
+    cache = get_embedding_cache(model_key(MODEL_NAME, backend))
+    vectors = [None] * len(images)
+    hashes = [None] * len(images)
+    failures = []
+    stats = {"images": 0, "encoded": 0, "cached": 0, "failed": 0}
+    done = 0
+    # spawn: torch and FAISS thread pools do not survive fork
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(assignment), mp_context=context) as executor:
+        futures = {executor.submit(_embed_shard, [image_paths[p] for p in positions],
+                                   backend, batch_size, threads_per_shard, use_pixel_cache): positions
+                   for positions in assignment}
+        for future in as_completed(futures):
+            positions = futures[future]
+            kept, embeddings, entries, shard_failures, shard_stats = future.result()
+            for row, (i, entry) in enumerate(zip(kept, entries)):
+                vectors[positions[i]] = embeddings[row]
+                hashes[positions[i]] = entry[2]
+                cache.record_stat(image_paths[positions[i]], entry)
+                cache.put(entry[2], embeddings[row])
+            failures.extend(shard_failures)
+            for key in stats:
+                stats[key] += shard_stats[key]
+            done += len(positions)
+            if progress:
+                progress(done, len(images))
+
+    kept = [i for i, vector in enumerate(vectors) if vector is not None]
+    if kept:
+        # Persist new embeddings and forget those of removed images
+        cache.save(keep_hashes=[hashes[i] for i in kept])
+        embeddings = np.vstack([vectors[i] for i in kept]).astype('float32')
+    else:
+        embeddings = np.zeros((0, 0), dtype='float32')
+
+    seconds = time.perf_counter() - start_time
+    stats["seconds"] = seconds
+    stats["images_per_sec"] = stats["encoded"] / seconds if seconds > 0 and stats["encoded"] else 0.0
+    stats["shards"] = len(assignment)
+    return ([images[i][0] for i in kept], [image_paths[i] for i in kept], embeddings,
+            failures, stats)
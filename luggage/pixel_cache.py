@@ -0,0 +1,151 @@
+"""
+On-disk store of decoded, resized and center-cropped images keyed by image content hash
+
+The pixels are what every CLIP-style backbone sees before normalization, so
+re-encoding the dataset with another model or backend reads them from a
+memory-mapped file instead of decoding and resizing each JPEG again.
+"""
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+from luggage.embedding_cache import PREPROCESS_VERSION
+from luggage.images import MODEL_INPUT_SIZE, load_image
+
+CACHE_DIR = "cache/pixels"
+# Bump when center_crop changes so that rows cropped the old way are not reused
+CROP_VERSION = 2
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+def center_crop(image, size=MODEL_INPUT_SIZE):
+    """Resize the shorter side to size (bicubic) and crop the center square
+
+    Same arithmetic as torchvision's Resize(size) and CenterCrop(size) used by
+    the CLIP preprocessing: the longer side is truncated, the offsets rounded.
+    """
+    width, height = image.size
+    if width <= height:
+        width, height = size, int(size * height / width)
+    else:
+        width, height = int(size * width / height), size
+    image = image.resize((width, height), Image.BICUBIC)
+    top = int(round((height - size) / 2.0))
+    left = int(round((width - size) / 2.0))
+    return image.crop((left, top, left + size, top + size))
+
+
+class PixelCache:
+    """Append-only uint8 array of size x size RGB images with a hash -> row table
+
+    Rows are appended to a raw file that is memory-mapped for reads; the row
+    table is saved separately. Appends and saves hold an exclusive lock on the
+    data file, so processes sharing the cache (the workers of sharded
+    indexing, or an evaluation next to the app) never write the same row, and
+    saving merges the rows other processes recorded meanwhile.
+    """
+
+    def __init__(self, size=MODEL_INPUT_SIZE, preprocess_version=PREPROCESS_VERSION, cache_dir=CACHE_DIR):
+        self.size = size
+        self.row_shape = (size, size, 3)
+        self.row_bytes = size * size * 3
+        name = f"pixels-{size}-p{preprocess_version}-c{CROP_VERSION}"
+        self.data_path = os.path.join(cache_dir, f"{name}.u8")
+        self.rows_path = os.path.join(cache_dir, f"{name}.json")
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._map = None
+        self._dirty = False
+        if os.path.exists(self.rows_path) and os.path.exists(self.data_path):
+            try:
+                with open(self.rows_path, 'r', encoding='utf-8') as f:
+                    self._rows = json.load(f)
+            except Exception as e:
+                print(f"Ignoring unreadable pixel cache {self.rows_path}: {e}")
+
+    def __len__(self):
+        return len(self._rows)
+
+    @contextmanager
+    def _locked_data(self):
+        """Open the data file with an exclusive lock held across processes"""
+        os.makedirs(os.path.dirname(self.data_path), exist_ok=True)
+        fd = os.open(self.data_path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, 'r+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _mapped(self, row):
+        """Return a memory map covering row, remapping the file after it grew"""
+        if self._map is None or len(self._map) <= row:
+            rows = os.path.getsize(self.data_path) // self.row_bytes
+            self._map = np.memmap(self.data_path, dtype='uint8', mode='r',
+                                  shape=(rows, *self.row_shape))
+        return self._map
+
+    def get(self, image_hash):
+        """Return the cached pixels of a content hash as a (size, size, 3) uint8 array, or None"""
+        row = self._rows.get(image_hash)
+        if row is None:
+            return None
+        with self._lock:
+            return np.array(self._mapped(row)[row])
+
+    def put(self, image_hash, pixels):
+        """Store the pixels of a content hash"""
+        pixels = np.ascontiguousarray(pixels, dtype='uint8').reshape(self.row_shape)
+        with self._lock:
+            if image_hash in self._rows:
+                return
+            with self._locked_data() as f:
+                # Append after the rows of every process; a partial row left by a crash is overwritten
+                row = f.seek(0, os.SEEK_END) // self.row_bytes
+                f.seek(row * self.row_bytes)
+                f.write(pixels.tobytes())
+            self._rows[image_hash] = row
+            self._dirty = True
+
+    def save(self):
+        """Persist the row table, merged with the rows saved by other processes"""
+        with self._lock:
+            if not self._dirty:
+                return
+            with self._locked_data():
+                if os.path.exists(self.rows_path):
+                    try:
+                        with open(self.rows_path, 'r', encoding='utf-8') as f:
+                            self._rows = {**json.load(f), **self._rows}
+                    except Exception as e:
+                        print(f"Overwriting unreadable pixel cache {self.rows_path}: {e}")
+                tmp_path = f"{self.rows_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self._rows, f)
+                os.replace(tmp_path, self.rows_path)
+            self._dirty = False
+
+    def load(self, image_hash, open_source):
+        """Return the model-sized image of a content hash; on a miss, decode the file returned by open_source() and cache it"""
+        pixels = self.get(image_hash)
+        if pixels is None:
+            with open_source() as f:
+                pixels = np.asarray(center_crop(load_image(f, size=self.size), self.size))
+            self.put(image_hash, pixels)
+        return Image.fromarray(pixels)
+
+
+def get_pixel_cache(size=MODEL_INPUT_SIZE):
+    """Return the process-wide pixel cache so that concurrent writers share one store"""
+    with _shared_caches_lock:
+        if size not in _shared_caches:
+            _shared_caches[size] = PixelCache(size)
+        return _shared_caches[size]
@@ -0,0 +1,47 @@
+"""
+Bounded LRU caches of query embeddings and search results, keyed by upload content hash
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+QUERY_CACHE_SIZE = 256
+
+
+def upload_hash(data):
+    """Return the hex SHA-256 digest of uploaded bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe mapping that evicts the least recently used entry beyond maxsize"""
+
+    def __init__(self, maxsize=QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value and mark it as recently used, or None"""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """Store a value, evicting the oldest entries beyond maxsize"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+# Shared by every session of the process. Embeddings depend only on the
+# upload; results also depend on the index generation and result count.
+query_embeddings = LRUCache()
+search_results = LRUCache()
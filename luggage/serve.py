@@ -0,0 +1,87 @@
+"""
+Production entry point: warm the search engine up, expose readiness, then run Streamlit
+
+Usage: python -m luggage.serve [streamlit run options]
+
+The warm-up runs in the Streamlit process, so the pages find the model and
+the index already loaded. GET /ready on READINESS_PORT answers 200 once the
+warm-up has finished and 503 before, which lets the reverse proxy hold
+traffic back until the first request can be served at full speed. The same
+server exposes GET /metrics in the Prometheus text format (luggage.metrics).
+"""
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from luggage import engine, metrics
+from luggage.config import load_app_config
+
+APP_SCRIPT = "app.py"
+READINESS_PORT = int(os.environ.get("READINESS_PORT", "8502"))
+
+_ready = threading.Event()
+
+
+class ReadinessHandler(BaseHTTPRequestHandler):
+    """Answer /ready with 200 once the engine is warm, 503 before, and serve /metrics"""
+
+    def do_GET(self):
+        content_type = "text/plain"
+        if self.path == "/ready":
+            status = 200 if _ready.is_set() else 503
+            body = b"ready\n" if status == 200 else b"warming up\n"
+        elif self.path == "/metrics":
+            status = 200
+            body = metrics.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Health checks poll every few seconds; keep them out of the logs
+        pass
+
+
+def start_readiness_server(port=READINESS_PORT):
+    """Serve the readiness endpoint from a daemon thread"""
+    server = ThreadingHTTPServer(("0.0.0.0", port), ReadinessHandler)
+    threading.Thread(target=server.serve_forever, name="readiness", daemon=True).start()
+    return server
+
+
+def warm_up():
+    """Load the model and the index and run a dummy query, then report ready"""
+    start_time = time.perf_counter()
+    try:
+        if engine.warm_up(load_app_config()):
+            print(f"Warm-up finished in {time.perf_counter() - start_time:.1f}s")
+        else:
+            print("Warm-up finished without an index: check the dataset")
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+    # Serve anyway: the pages report a missing index or retry the build themselves
+    _ready.set()
+
+
+def main(argv=None):
+    start_readiness_server()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+    # Imported last: Streamlit takes over the main thread until shutdown
+    from streamlit.web import cli as stcli
+
+    argv = sys.argv[1:] if argv is None else argv
+    sys.argv = ["streamlit", "run", APP_SCRIPT, *argv]
+    return stcli.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
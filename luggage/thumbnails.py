@@ -0,0 +1,63 @@
+"""
+Disk cache of the thumbnails shown in the administration image grid
+
+A thumbnail is named after the size and mtime of its source image, so an
+edited image gets a new thumbnail and never serves the old one.
+"""
+import os
+import shutil
+
+from luggage.images import load_image
+from luggage.packed_store import open_image
+
+THUMBNAIL_DIR = "cache/thumbnails"
+THUMBNAIL_SIZE = 150
+
+
+def _thumbnail_folder(image_path, thumbnail_dir=THUMBNAIL_DIR):
+    """Return the cache folder mirroring the article folder of an image"""
+    article_id = os.path.basename(os.path.dirname(os.path.normpath(image_path)))
+    return os.path.join(thumbnail_dir, article_id)
+
+
+def _stale_thumbnails(folder, image_name):
+    """Return the cached thumbnails of an image, whatever version they were made from"""
+    if not os.path.isdir(folder):
+        return []
+    prefix = f"{image_name}."
+    return [os.path.join(folder, f) for f in os.listdir(folder)
+            if f.startswith(prefix) and f.endswith(".jpg")]
+
+
+def get_thumbnail(image_path, size=THUMBNAIL_SIZE, thumbnail_dir=THUMBNAIL_DIR):
+    """Return the path of an up-to-date thumbnail of an image, creating it on first use"""
+    stat = os.stat(image_path)
+    folder = _thumbnail_folder(image_path, thumbnail_dir)
+    image_name = os.path.basename(image_path)
+    thumbnail_path = os.path.join(
+        folder, f"{image_name}.{size}-{stat.st_size}-{stat.st_mtime_ns}.jpg")
+    if os.path.exists(thumbnail_path):
+        return thumbnail_path
+
+    with open_image(image_path, resized_ok=True) as f:
+        image = load_image(f, size=size)
+    image.thumbnail((size, size))
+    for stale_path in _stale_thumbnails(folder, image_name):
+        os.remove(stale_path)
+    os.makedirs(folder, exist_ok=True)
+    tmp_path = f"{thumbnail_path}.tmp"
+    image.save(tmp_path, format='JPEG', quality=85)
+    os.replace(tmp_path, thumbnail_path)
+    return thumbnail_path
+
+
+def delete_thumbnails(image_path, thumbnail_dir=THUMBNAIL_DIR):
+    """Remove the cached thumbnails of a deleted image"""
+    folder = _thumbnail_folder(image_path, thumbnail_dir)
+    for thumbnail_path in _stale_thumbnails(folder, os.path.basename(image_path)):
+        os.remove(thumbnail_path)
+
+
+def delete_article_thumbnails(article_id, thumbnail_dir=THUMBNAIL_DIR):
+    """Remove the cached thumbnails of a deleted article"""
+    shutil.rmtree(os.path.join(thumbnail_dir, article_id), ignore_errors=True)
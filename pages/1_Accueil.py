@@ -1,13 +1,16 @@
-import json
+import io
 import os
+import time
 
-import clip
-import faiss
-import numpy as np
 import streamlit as st
-import torch
 from PIL import Image
 
+from luggage import config as app_config
+from luggage import engine, metadata
+from luggage.images import load_image
+from luggage.metrics import QUERY_STAGE_SECONDS
+from luggage.query_cache import upload_hash
+
 # Page configuration
 st.set_page_config(
     page_title="Reconnaissance IA de Roulettes & Pièces Valises – Roulettesdevalise.com",
@@ -59,122 +62,85 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-@st.cache_resource
-def load_model():
-    """Load CLIP model and return model, preprocess function, and device"""
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model, preprocess = clip.load("ViT-B/32", device=device)
-    return model, preprocess, device
-
-
-def load_metadata():
-    """Load metadata from JSON file"""
-    metadata_path = "dataset/metadata.json"
-    if os.path.exists(metadata_path):
-        try:
-            with open(metadata_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            st.error(f"Erreur lors du chargement du metadata: {str(e)}")
-            return []
-    return []
-
-
 def get_article_urls(article_id):
-    """Get URLs for a specific article from metadata"""
-    metadata = load_metadata()
-    for entry in metadata:
-        if entry["label"] == article_id:
-            return entry.get("url-roulette", "Non trouvé"), entry.get("url-kit", "Non trouvé")
-    return "Non trouvé", "Non trouvé"
-
-
-def get_dataset_folders():
-    """Get list of folders in dataset directory"""
-    dataset_path = "dataset/"
-    if not os.path.exists(dataset_path):
-        return []
-    return [f for f in os.listdir(dataset_path) if os.path.isdir(os.path.join(dataset_path, f))]
+    """Get URLs for a specific article from the cached metadata"""
+    try:
+        with QUERY_STAGE_SECONDS.time(stage="metadata"):
+            return metadata.get_article_urls(article_id)
+    except Exception as e:
+        st.error(f"Erreur lors du chargement du metadata: {str(e)}")
+        return "Non trouvé", "Non trouvé"
 
 
 def load_app_config():
     """Load application configuration from JSON file"""
-    config_path = "./dataset/app_config.json"
-    if os.path.exists(config_path):
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            return {"num_results": 3, "rebuild_index": False}
-    return {"num_results": 3, "rebuild_index": False}
+    try:
+        return app_config.load_app_config()
+    except Exception as e:
+        return dict(app_config.DEFAULT_CONFIG)
 
 
 def save_app_config(config):
     """Save application configuration to JSON file"""
-    config_path = "./dataset/app_config.json"
     try:
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
+        app_config.save_app_config(config)
         return True
     except Exception as e:
         return False
 
 
-@st.cache_data
-def build_faiss_index():
-    """Build FAISS index from dataset images"""
-    model, preprocess, device = load_model()
+def render_results(sorted_results):
+    """Display result cards and the best match summary"""
+    st.markdown("### 🎯 Articles les plus similaires")
+    st.markdown("---")
 
-    embeddings = []
-    ids = []
+    for i, (article_id, distance) in enumerate(sorted_results):
+        # Get URLs from metadata
+        url_roulette, url_kit = get_article_urls(article_id)
+
+        # Create result card
+        with st.container():
+            # Create clickable URLs with truncated display
+            roulette_display = url_roulette[:40] + "..." if len(
+                url_roulette) > 30 and url_roulette != "Non trouvé" else url_roulette
+            kit_display = url_kit[:30] + "..." if len(
+                url_kit) > 30 and url_kit != "Non trouvé" else url_kit
+
+            roulette_link = f'<a href="{url_roulette}" target="_blank" style="color: #1f77b4; text-decoration: none;" title="{url_roulette}">{roulette_display}</a>' if url_roulette != "Non trouvé" else "Non trouvé"
+            kit_link = f'<a href="{url_kit}" target="_blank" style="color: #1f77b4; text-decoration: none;" title="{url_kit}">{kit_display}</a>' if url_kit != "Non trouvé" else "Non trouvé"
+
+            st.markdown(f"""
+            <div class="similarity-card">
+                <div class="article-id">#{i+1} ID Article: {article_id}</div>
+                <div class="metadata">Distance: {distance:.4f}</div>
+                <div class="metadata">Lien Roulette: {roulette_link}</div>
+                <div class="metadata">Lien Kit: {kit_link}</div>
+            </div>
+            """, unsafe_allow_html=True)
+
+    # Summary
+    st.markdown("---")
+    if sorted_results:
+        best_article_id = sorted_results[0][0]
+        best_distance = sorted_results[0][1]
+        st.markdown(
+            f"**Meilleur match:** {best_article_id} avec une distance de {best_distance:.4f}")
 
-    dataset_path = "dataset/"
-    if not os.path.exists(dataset_path):
-        st.error(f"Chemin du dataset '{dataset_path}' introuvable!")
-        return None, None
 
+def wait_for_index():
+    """Show the progress of the background build until it finishes"""
     progress_bar = st.progress(0)
     status_text = st.empty()
-
-    folders = get_dataset_folders()
-    total_folders = len(folders)
-
-    for idx, id_article in enumerate(folders):
-        folder = os.path.join(dataset_path, id_article)
-        status_text.text(f"Traitement du dossier: {id_article}")
-
-        for file in os.listdir(folder):
-            if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff')):
-                try:
-                    image_path = os.path.join(folder, file)
-                    image = preprocess(Image.open(image_path)
-                                       ).unsqueeze(0).to(device)
-                    with torch.no_grad():
-                        emb = model.encode_image(image).cpu().numpy()
-                    embeddings.append(emb)
-                    ids.append(id_article)
-                except Exception as e:
-                    st.warning(
-                        f"Erreur lors du traitement de {image_path}: {str(e)}")
-
-        progress_bar.progress((idx + 1) / total_folders)
-
-    if not embeddings:
-        st.error("Aucune image valide trouvée dans le dataset!")
-        return None, None
-
-    embeddings = np.vstack(embeddings).astype("float32")
-
-    # Build FAISS index
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)  # pylint: disable=no-value-for-parameter
-
-    status_text.text("Index construit avec succès!")
+    while engine.rebuild_status()["running"]:
+        status = engine.rebuild_status()
+        if status["total"]:
+            progress_bar.progress(status["done"] / status["total"])
+            status_text.text(
+                f"Encodage des images: {status['done']}/{status['total']}")
+        time.sleep(0.25)
     progress_bar.empty()
     status_text.empty()
 
-    return index, ids
-
 
 def main():
     # Header
@@ -226,35 +192,34 @@ def main():
     config = load_app_config()
     rebuild_needed = config.get('rebuild_index', False)
 
-    # Initialize session state - build index if not cached or rebuild is needed
-    if 'index' not in st.session_state or 'ids' not in st.session_state or rebuild_needed:
-        if rebuild_needed:
-            print("Rebuilding index due to admin request")
-            st.info("🔄 Reconstruction de l'index demandée par l'administration...")
-
-            # Clear all cached data
-            if 'index' in st.session_state:
-                del st.session_state.index
-            if 'ids' in st.session_state:
-                del st.session_state.ids
-
-            # Clear the cached build_faiss_index function
-            build_faiss_index.clear()
-
-            # Clear the rebuild flag
-            config['rebuild_index'] = False
-            save_app_config(config)
-
+    if not os.path.exists("dataset/"):
+        st.error("Chemin du dataset 'dataset/' introuvable!")
+        return
+
+    # Rebuild in the background: the current generation keeps serving meanwhile
+    if rebuild_needed:
+        # Clear the rebuild flag
+        config['rebuild_index'] = False
+        save_app_config(config)
+        if engine.start_rebuild(config):
+            print("Rebuilding index in the background due to admin request")
+    elif engine.settings_changed(config) and not engine.rebuild_status()["error"]:
+        # Index type or inference backend changed in the config
+        if engine.start_rebuild(config):
+            print("Rebuilding index in the background after an index settings change")
+
+    # The very first build has nothing to serve yet, so wait for it
+    live_index = engine.ensure_index(config)
+    if live_index is None:
         with st.spinner("Chargement du modèle et construction de l'index..."):
-            index, ids = build_faiss_index()
-            if index is not None:
-                st.session_state.index = index
-                st.session_state.ids = ids
-                st.success("✅ Index construit avec succès!")
-            else:
-                st.error(
-                    "❌ Échec de la construction de l'index. Veuillez vérifier votre dataset.")
-                return
+            wait_for_index()
+        live_index = engine.current_index()
+        if live_index is not None:
+            st.success("✅ Index construit avec succès!")
+        else:
+            st.error(
+                "❌ Échec de la construction de l'index. Veuillez vérifier votre dataset.")
+            return
 
     # Main content area
     col1, col2 = st.columns([1, 1])
@@ -269,9 +234,17 @@ def main():
         )
 
         if uploaded_file is not None:
+            image_bytes = uploaded_file.getvalue()
+            image_hash = upload_hash(image_bytes)
+            # Decode once per upload: reruns reuse the image kept in the session
+            uploaded_image = st.session_state.get('uploaded_image')
+            if uploaded_image is None or uploaded_image[0] != image_hash:
+                # Reduced-resolution decode, upright according to EXIF
+                with QUERY_STAGE_SECONDS.time(stage="decode"):
+                    uploaded_image = (image_hash, load_image(io.BytesIO(image_bytes)))
+                st.session_state.uploaded_image = uploaded_image
             # Display uploaded image
-            image = Image.open(uploaded_file)
-            st.image(image, caption="Image téléchargée",
+            st.image(uploaded_image[1], caption="Image téléchargée",
                      use_container_width=True)
         # Instructions for taking good photos
         st.warning("""
@@ -313,92 +286,26 @@ def main():
         if uploaded_file is not None:
             if st.button("🔍 Trouver des Articles Similaires", type="primary"):
                 with st.spinner("Analyse de l'image et recherche d'articles similaires..."):
-                    # Load model
-                    model, preprocess, device = load_model()
-
-                    # Process uploaded image
                     try:
-                        # Convert uploaded file to PIL Image and preprocess
-                        query_img = preprocess(image).unsqueeze(0).to(device)
-
-                        # Encode image
-                        with torch.no_grad():
-                            q_emb = model.encode_image(query_img).cpu().numpy()
-
-                        # Search for similar images - Get more results to ensure we get unique article IDs
-                        # Search more results
-                        search_k = min(50, len(st.session_state.ids))
-                        # FAISS search returns distances and indices
-                        D, I = st.session_state.index.search(q_emb.astype( # pylint: disable=no-value-for-parameter
-                            'float32'), search_k)  # pylint: disable=no-value-for-parameter
-
-                        # Get unique article IDs with their best scores
-                        unique_results = {}
-                        for i in range(search_k):
-                            article_id = st.session_state.ids[I[0][i]]
-                            distance = D[0][i]
-
-                            # Keep only the best (lowest distance) for each article ID
-                            if article_id not in unique_results or distance < unique_results[article_id]['distance']:
-                                unique_results[article_id] = {
-                                    'distance': distance,
-                                    'index': i
-                                }
-
-                        # Sort by distance (lower is better) and take top results
-                        sorted_results = sorted(unique_results.items(
-                        ), key=lambda x: x[1]['distance'])[:num_results]
-
-                        # Display results
-                        st.markdown("### 🎯 Articles les plus similaires")
-                        st.markdown("---")
-
-                        for i, (article_id, result_info) in enumerate(sorted_results):
-                            distance = result_info['distance']
-
-                            # Get URLs from metadata
-                            url_roulette, url_kit = get_article_urls(
-                                article_id)
-
-                            # Create result card
-                            with st.container():
-                                # Create clickable URLs with truncated display
-                                roulette_display = url_roulette[:40] + "..." if len(
-                                    url_roulette) > 30 and url_roulette != "Non trouvé" else url_roulette
-                                kit_display = url_kit[:30] + "..." if len(
-                                    url_kit) > 30 and url_kit != "Non trouvé" else url_kit
-
-                                roulette_link = f'<a href="{url_roulette}" target="_blank" style="color: #1f77b4; text-decoration: none;" title="{url_roulette}">{roulette_display}</a>' if url_roulette != "Non trouvé" else "Non trouvé"
-                                kit_link = f'<a href="{url_kit}" target="_blank" style="color: #1f77b4; text-decoration: none;" title="{url_kit}">{kit_display}</a>' if url_kit != "Non trouvé" else "Non trouvé"
-
-                                st.markdown(f"""
-                                <div class="similarity-card">
-                                    <div class="article-id">#{i+1} ID Article: {article_id}</div>
-                                    <div class="metadata">Distance: {distance:.4f}</div>
-                                    <div class="metadata">Lien Roulette: {roulette_link}</div>
-                                    <div class="metadata">Lien Kit: {kit_link}</div>
-                                </div>
-                                """, unsafe_allow_html=True)
-
-                        # Summary
-                        st.markdown("---")
-                        if sorted_results:
-                            best_article_id = sorted_results[0][0]
-                            best_distance = sorted_results[0][1]['distance']
-                            st.markdown(
-                                f"**Meilleur match:** {best_article_id} avec une distance de {best_distance:.4f}")
-
+                        sorted_results = engine.search(
+                            image_hash, uploaded_image[1], num_results, config)
+                        # Keep the results so that other buttons do not clear them
+                        st.session_state.last_search = (image_hash, sorted_results)
                     except Exception as e:
                         st.error(
                             f"Erreur lors du traitement de l'image: {str(e)}")
+
+            last_search = st.session_state.get('last_search')
+            if last_search is not None and last_search[0] == image_hash:
+                render_results(last_search[1])
         else:
             st.info("👆 Veuillez télécharger une image pour commencer")
 
     # Footer
     st.markdown("---")
     st.markdown("### 📊 Informations sur le Dataset")
-    if 'ids' in st.session_state:
-        total_images = len(st.session_state.ids)
+    if live_index is not None:
+        total_images = live_index.num_images
         st.metric(
             f"Le modèle utilise pour la recherche de similarité un total d'images :", total_images)
 
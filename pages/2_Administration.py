@@ -1,14 +1,13 @@
-import json
 import os
 import shutil
 import time
 
-import clip
-import faiss
-import numpy as np
 import streamlit as st
-import torch
-from PIL import Image
+
+from luggage import config as app_config
+from luggage import dataset_manifest, engine
+from luggage import metadata as metadata_store
+from luggage import thumbnails
 
 # Page configuration
 st.set_page_config(
@@ -54,43 +53,55 @@ st.markdown("""
 
 
 def get_dataset_structure():
-    """Get the current dataset structure"""
-    dataset_path = "dataset/"
-    if not os.path.exists(dataset_path):
-        return {}
-
-    structure = {}
-    for item in os.listdir(dataset_path):
-        item_path = os.path.join(dataset_path, item)
-        if os.path.isdir(item_path):
-            images = [f for f in os.listdir(item_path)
-                      if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff'))]
-            structure[item] = images
-
-    return structure
+    """Get the current dataset structure from the cached manifest"""
+    return dataset_manifest.dataset_structure()
 
 
 def delete_image(article_id, image_name):
-    """Delete an image from the dataset"""
+    """Delete an image from the dataset and from the live search index"""
     image_path = os.path.join("dataset", article_id, image_name)
     if os.path.exists(image_path):
         os.remove(image_path)
+        dataset_manifest.forget_image(article_id, image_name)
+        engine.remove_images([image_path])
+        thumbnails.delete_thumbnails(image_path)
         return True
     return False
 
 
-def add_image_to_article(article_id, uploaded_file):
-    """Add an uploaded image to an article directory"""
+def add_images_to_article(article_id, uploaded_files):
+    """Add uploaded images to an article directory; return the number of images saved"""
     article_path = os.path.join("dataset", article_id)
     if not os.path.exists(article_path):
         os.makedirs(article_path)
 
-    # Save the uploaded file
-    file_path = os.path.join(article_path, uploaded_file.name)
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    # Save every uploaded file first
+    file_paths = []
+    for uploaded_file in uploaded_files:
+        file_path = os.path.join(article_path, uploaded_file.name)
+        data = uploaded_file.getvalue()
+        try:
+            with open(file_path, "wb") as f:
+                f.write(data)
+        except Exception as e:
+            st.warning(f"Erreur lors de l'enregistrement de {uploaded_file.name}: {str(e)}")
+            continue
+        dataset_manifest.record_image(article_id, uploaded_file.name)
+        file_paths.append(file_path)
+
+    # Encode the new images in one batch and publish a single new index generation
+    if file_paths:
+        for image_path, error in engine.index_images(article_id, file_paths):
+            st.warning(f"Erreur lors de l'indexation de {image_path}: {str(error)}")
+
+    # Prepare the thumbnails of the image grid now rather than on the next visit
+    for file_path in file_paths:
+        try:
+            thumbnails.get_thumbnail(file_path)
+        except Exception:
+            pass
 
-    return True
+    return len(file_paths)
 
 
 def delete_article_folder(article_id):
@@ -98,29 +109,26 @@ def delete_article_folder(article_id):
     article_path = os.path.join("dataset", article_id)
     if os.path.exists(article_path):
         shutil.rmtree(article_path)
+        dataset_manifest.forget_article(article_id)
+        engine.remove_article(article_id)
+        thumbnails.delete_article_thumbnails(article_id)
         return True
     return False
 
 
 def load_metadata():
-    """Load metadata from JSON file"""
-    metadata_path = "dataset/metadata.json"
-    if os.path.exists(metadata_path):
-        try:
-            with open(metadata_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            st.error(f"Erreur lors du chargement du metadata: {str(e)}")
-            return []
-    return []
+    """Load metadata from the cached metadata file"""
+    try:
+        return metadata_store.load_metadata()
+    except Exception as e:
+        st.error(f"Erreur lors du chargement du metadata: {str(e)}")
+        return []
 
 
 def save_metadata(metadata):
-    """Save metadata to JSON file"""
-    metadata_path = "dataset/metadata.json"
+    """Save metadata to JSON file and refresh the cached copy"""
     try:
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=4, ensure_ascii=False)
+        metadata_store.save_metadata(metadata)
         return True
     except Exception as e:
         st.error(f"Erreur lors de la sauvegarde du metadata: {str(e)}")
@@ -173,106 +181,24 @@ def delete_metadata_entry_by_index(index):
 
 def load_app_config():
     """Load application configuration from JSON file"""
-    config_path = "./dataset/app_config.json"
-    if os.path.exists(config_path):
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            st.error(
-                f"Erreur lors du chargement de la configuration: {str(e)}")
-            return {"num_results": 3, "rebuild_index": False, "admin_password": ""}
-    return {"num_results": 3, "rebuild_index": False, "admin_password": ""}
+    try:
+        return app_config.load_app_config()
+    except Exception as e:
+        st.error(
+            f"Erreur lors du chargement de la configuration: {str(e)}")
+        return dict(app_config.DEFAULT_CONFIG)
 
 
 def save_app_config(config):
     """Save application configuration to JSON file"""
-    config_path = "./dataset/app_config.json"
     try:
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
+        app_config.save_app_config(config)
         return True
     except Exception as e:
         st.error(f"Erreur lors de la sauvegarde de la configuration: {str(e)}")
         return False
 
 
-@st.cache_resource
-def load_model():
-    """Load CLIP model and return model, preprocess function, and device"""
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model, preprocess = clip.load("ViT-B/32", device=device)
-    return model, preprocess, device
-
-
-@st.cache_data
-def build_faiss_index():
-    """Build FAISS index from dataset images"""
-    model, preprocess, device = load_model()
-
-    embeddings = []
-    ids = []
-
-    dataset_path = "dataset/"
-    if not os.path.exists(dataset_path):
-        st.error(f"Chemin du dataset '{dataset_path}' introuvable!")
-        return None, None
-
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-
-    # Get all article directories
-    article_dirs = [f for f in os.listdir(dataset_path)
-                    if os.path.isdir(os.path.join(dataset_path, f))]
-
-    total_articles = len(article_dirs)
-    processed_articles = 0
-
-    for article_id in article_dirs:
-        article_path = os.path.join(dataset_path, article_id)
-        images = [f for f in os.listdir(article_path)
-                  if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff'))]
-
-        for image_name in images:
-            image_path = os.path.join(article_path, image_name)
-            try:
-                # Load and preprocess image
-                image = Image.open(image_path).convert('RGB')
-                image_tensor = preprocess(image).unsqueeze(0).to(device)
-
-                # Encode image
-                with torch.no_grad():
-                    embedding = model.encode_image(image_tensor).cpu().numpy()
-                    embeddings.append(embedding.flatten())
-                    ids.append(f"{article_id}/{image_name}")
-
-            except Exception as e:
-                st.warning(
-                    f"Erreur lors du traitement de {image_path}: {str(e)}")
-
-        processed_articles += 1
-        progress = processed_articles / total_articles
-        progress_bar.progress(progress)
-        status_text.text(
-            f"Traitement de l'article {article_id} ({processed_articles}/{total_articles})")
-
-    if not embeddings:
-        st.error("Aucune image valide trouvée dans le dataset!")
-        return None, None
-
-    # Build FAISS index
-    embeddings_array = np.array(embeddings).astype('float32')
-    dimension = embeddings_array.shape[1]
-
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings_array)  # pylint: disable=no-value-for-parameter
-
-    progress_bar.empty()
-    status_text.empty()
-
-    return index, ids
-
-
 def main():
     # Load configuration
     config = load_app_config()
@@ -339,15 +265,13 @@ def main():
 
         # Rebuild index button
         if st.button("🔄 Reconstruire l'Index", type="secondary", use_container_width=True):
-            # Set rebuild flag in config to trigger rebuild on Accueil page
-            config = load_app_config()
-            config['rebuild_index'] = True
-            if save_app_config(config):
+            # Rebuild in the shared engine; the current index keeps serving meanwhile
+            if engine.start_rebuild(load_app_config()):
                 st.success(
-                    "✅ L'index sera reconstruit automatiquement sur la page d'accueil.")
+                    "✅ L'index est en cours de reconstruction en arrière-plan.")
             else:
-                st.error(
-                    "❌ Erreur lors de la sauvegarde de la configuration de reconstruction.")
+                st.info("🔄 Une reconstruction de l'index est déjà en cours.")
+            time.sleep(2)  # Wait 2 seconds to show the message
             st.rerun()
 
         st.markdown("---")
@@ -387,6 +311,7 @@ def main():
                     st.error(f"❌ L'article {new_article_id} existe déjà!")
                 else:
                     os.makedirs(article_path)
+                    dataset_manifest.record_article(new_article_id)
                     st.success(f"✅ Article {new_article_id} créé avec succès!")
                     time.sleep(2)  # Wait 2 seconds to show the message
                     st.rerun()
@@ -419,10 +344,7 @@ def main():
 
     if uploaded_files and selected_article:
         if st.button("📤 Ajouter les Images", type="primary"):
-            success_count = 0
-            for uploaded_file in uploaded_files:
-                if add_image_to_article(selected_article, uploaded_file):
-                    success_count += 1
+            success_count = add_images_to_article(selected_article, uploaded_files)
 
             if success_count > 0:
                 st.success(
@@ -574,10 +496,8 @@ def main():
                     image_path = os.path.join(
                         "dataset", selected_article_del, image_name)
                     try:
-                        # Display thumbnail
-                        img = Image.open(image_path)
-                        img.thumbnail((150, 150))
-                        st.image(img, caption=image_name,
+                        # Display the cached thumbnail, created once per image version
+                        st.image(thumbnails.get_thumbnail(image_path), caption=image_name,
                                  use_container_width=True)
 
                         # Delete button
@@ -0,0 +1,63 @@
+"""
+Changes to an index loaded from the memory-mapped artifact
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+
+from luggage import live_index  # noqa: E402
+from luggage.artifact import load_artifact, save_artifact  # noqa: E402
+from luggage.labels import LabelTable  # noqa: E402
+
+DIM = 16
+
+
+def _vectors(count, seed):
+    vectors = np.random.default_rng(seed).standard_normal((count, DIM)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """Two articles of two images in a dataset laid out like dataset/<article_id>/<file name>"""
+    images = []
+    for article_id in ("A1", "A2"):
+        (tmp_path / "dataset" / article_id).mkdir(parents=True)
+        for name in ("1.jpg", "2.jpg"):
+            path = tmp_path / "dataset" / article_id / name
+            path.write_bytes(f"{article_id}/{name}".encode())
+            images.append((article_id, str(path)))
+    return tmp_path, images
+
+
+@pytest.fixture(autouse=True)
+def no_current_index(monkeypatch):
+    monkeypatch.setattr(live_index, "_current", None)
+
+
+def test_loaded_artifact_accepts_additions_and_removals(dataset):
+    tmp_path, images = dataset
+    article_ids, image_paths = zip(*images)
+    index = live_index.create_index(_vectors(len(images), 0))
+    save_artifact(index, LabelTable.from_paths(article_ids, image_paths), {}, "test-model",
+                  output_dir=str(tmp_path / "index"))
+
+    loaded = load_artifact("test-model", output_dir=str(tmp_path / "index"))
+    assert loaded is not None
+    index, labels, _ = loaded
+    live_index.publish_faiss_index(index, labels)
+
+    new_path = tmp_path / "dataset" / "A2" / "3.jpg"
+    new_path.write_bytes(b"A2/3.jpg")
+    handle = live_index.add_images(["A2"], [str(new_path)], _vectors(1, 1))
+    assert handle.num_images == 5
+    assert handle.vector_id(str(new_path)) == 4
+
+    handle = live_index.remove_images([image_paths[0]])
+    assert handle.num_images == 4
+    handle = live_index.remove_article("A2")
+    assert handle.labels.image_paths() == [image_paths[1]]
+    assert handle.index.ntotal == 1
+    # The mapped generation is left untouched
+    assert index.ntotal == len(images)
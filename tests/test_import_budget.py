@@ -0,0 +1,22 @@
+"""
+The page modules must import quickly and without the ML libraries
+"""
+import os
+
+import pytest
+
+from luggage.import_budget import DEFAULT_BUDGET, PAGE_MODULES, measure
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module", PAGE_MODULES)
+def test_page_module_import_budget(module, monkeypatch):
+    # The probe interpreter imports the luggage package from its working directory
+    monkeypatch.chdir(REPO_ROOT)
+    try:
+        seconds, heavy = measure(module)
+    except ImportError as e:
+        pytest.skip(f"{module} cannot be imported here: {e}")
+    assert heavy == []
+    assert seconds <= DEFAULT_BUDGET
@@ -0,0 +1,46 @@
+"""
+Removals from the published index keep the remaining vectors under their own labels
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+
+from luggage import live_index  # noqa: E402
+from luggage.index_factory import index_settings  # noqa: E402
+
+DIM = 64
+IMAGES_PER_ARTICLE = 5
+
+
+@pytest.fixture(autouse=True)
+def no_current_index(monkeypatch):
+    monkeypatch.setattr(live_index, "_current", None)
+
+
+def _clustered_dataset(num_images, seed=0):
+    """Return (article_ids, image_paths, vectors): the images of an article lie close together"""
+    rng = np.random.default_rng(seed)
+    num_articles = num_images // IMAGES_PER_ARTICLE
+    centers = rng.standard_normal((num_articles, DIM)).astype('float32')
+    article_ids, image_paths, vectors = [], [], []
+    for a in range(num_articles):
+        for i in range(IMAGES_PER_ARTICLE):
+            article_ids.append(f"A{a:03d}")
+            image_paths.append(f"dataset/A{a:03d}/{i}.jpg")
+            vectors.append(centers[a] + 0.05 * rng.standard_normal(DIM).astype('float32'))
+    return article_ids, image_paths, np.array(vectors, dtype='float32')
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivfpq"])
+def test_remove_article_keeps_labels_of_remaining_vectors(index_type):
+    article_ids, image_paths, vectors = _clustered_dataset(2000)
+    live_index.publish_index(article_ids, image_paths, vectors,
+                             index_settings({"index_type": index_type}))
+
+    handle = live_index.remove_article("A000")
+    queries = range(IMAGES_PER_ARTICLE, len(vectors), 37)
+    found = [handle.search_articles(vectors[q].reshape(1, -1), 1)[0][0] for q in queries]
+    assert found == [article_ids[q] for q in queries]
+    assert "A000" not in {article_id for article_id, _ in
+                          handle.search_articles(vectors[0].reshape(1, -1), 3)}